@@ -1,50 +1,176 @@
+import hashlib
+import json
 import os
 from dotenv import load_dotenv
-from sqlmodel import SQLModel
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from app.database import async_engine
-from app.command_handlers import start, account, manage_users
+from app.fsm_storage import PostgresStorage, create_fsm_storage
+from app.middlewares.activity import ActivityMiddleware
+from app.middlewares.auth import AuthMiddleware
+from app.middlewares.latency import LatencyMiddleware
+from app.middlewares.metrics import BotApiMetricsMiddleware, HandlerMetricsMiddleware
+from app.middlewares.text_command import TextCommandMiddleware
+from app.middlewares.throttling import ThrottlingMiddleware
+from app.middlewares.unit_of_work import ReleaseConnectionMiddleware, UnitOfWorkMiddleware
+from app.metrics import start_metrics_server
+from app.migrations import migrate, read_meta, write_meta
+from app.send_scheduler import SendScheduler
+from app.services.broadcast.engine import broadcaster
+from app.services.user.activity import activity_recorder
+from app.services.user.invalidation import user_cache_listener
+from app.services.user.purge import user_purger
+from app.startup import startup_timer
+from app.update_scheduler import update_scheduler
 
 
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
+# "polling" (default) or "webhook", see app/webhook.py for webhook settings
+RUN_MODE = os.getenv("BOT_RUN_MODE", "polling")
+# > 1 to process updates in that many worker processes, see app/workers.py
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
 
 
-async def init_db():
-    async with async_engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
+# Commands shown in the Telegram UI
+BOT_COMMANDS = [
+    BotCommand(command="start", description="Start the bot"),
+    BotCommand(command="account", description="View account details"),
+]
+
+
+async def sync_bot_commands(bot: Bot, meta: dict[str, str]) -> bool:
+    """Call set_my_commands only if the list changed since the last boot."""
+    key = f"bot_commands:{bot.id}"
+    digest = hashlib.sha256(
+        json.dumps([command.model_dump() for command in BOT_COMMANDS], sort_keys=True).encode()
+    ).hexdigest()
+    if meta.get(key) == digest:
+        return False
+
+    await bot.set_my_commands(BOT_COMMANDS)
+    await write_meta(key, digest)
+    return True
+
+
+def create_bot() -> Bot:
+    bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    # Don't hold the update's DB connection while waiting on Telegram
+    bot.session.middleware(ReleaseConnectionMiddleware())
+    # Registered before metrics so queueing time isn't counted as Bot API latency
+    bot.session.middleware(SendScheduler())
+    bot.session.middleware(BotApiMetricsMiddleware())
+    return bot
+
+
+def create_dispatcher(throttling: bool = True, scheduling: bool = True) -> Dispatcher:
+    """
+    `scheduling=False` leaves out the update scheduler, for callers that order
+    and bound updates themselves (worker processes).
+    """
+    # Imported here so processes that only receive updates don't load handlers
+    from app.command_handlers import start, account, manage_users
+
+    storage = create_fsm_storage()
+    dp = Dispatcher(storage=storage)
+    if isinstance(storage, PostgresStorage):
+        dp.startup.register(storage.start_cleanup)
+
+    # Let accepted updates finish before the services below shut down
+    if scheduling:
+        dp.shutdown.register(update_scheduler.drain)
+
+    # Resume broadcasts interrupted by a restart, stop (and checkpoint) on exit
+    dp.startup.register(broadcaster.resume)
+    dp.shutdown.register(broadcaster.stop)
+
+    # Drop cached users changed by other processes (role changes, deletes, ...)
+    dp.startup.register(user_cache_listener.start)
+    dp.shutdown.register(user_cache_listener.stop)
+
+    # Batched last-seen/message-count writes, flushed once more on shutdown
+    dp.startup.register(activity_recorder.start)
+    dp.shutdown.register(activity_recorder.stop)
+
+    # Hard-delete soft-deleted users in small batches
+    dp.startup.register(user_purger.start)
+    dp.shutdown.register(user_purger.stop)
+
+    # Drop floods first, before they take a handler slot or touch the DB
+    if throttling:
+        dp.update.outer_middleware(ThrottlingMiddleware())
+    # Caps concurrent handlers and runs each user's updates in order
+    if scheduling:
+        dp.update.outer_middleware(update_scheduler)
+    dp.update.outer_middleware(LatencyMiddleware())
+    # One DB connection per update, shared by everything below
+    dp.update.outer_middleware(UnitOfWorkMiddleware())
+    # Resolve the caller's User once per update for all routers
+    dp.update.outer_middleware(AuthMiddleware())
+    dp.update.outer_middleware(ActivityMiddleware())
+    # Match free-text commands once per message instead of once per filter
+    dp.message.outer_middleware(TextCommandMiddleware())
+
+    dp.include_router(start.router)
+    dp.include_router(account.router)
+    dp.include_router(manage_users.router)
+
+    # Inner middlewares on the root router wrap the handlers of every sub-router
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+
+    return dp
 
 
 async def run_the_bot() -> None:
     try:
         # Initialize Bot instance
         print(f"Initialize Bot instance...")
-        bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-        dp = Dispatcher()
+        bot = create_bot()
 
-        # Initialize the database
+        # Bring the schema up to date (a single query when nothing changed)
         print(f"Initializing the database...")
-        await init_db()
+        with startup_timer.phase("db"):
+            meta = await read_meta()
+            applied = await migrate(meta)
+        if applied:
+            print(f"Applied {applied} migration(s)")
+
+        with startup_timer.phase("commands"):
+            if not await sync_bot_commands(bot, meta):
+                print("Bot commands unchanged, skipping set_my_commands")
 
-        # Set bot commands shown in the Telegram UI
-        commands = [
-            BotCommand(command="start", description="Start the bot"),
-            BotCommand(command="account", description="View account details"),
-        ]
+        await start_metrics_server()
 
-        await bot.set_my_commands(commands)
+        # Fan updates out to worker processes, each with its own Dispatcher
+        if BOT_WORKERS > 1:
+            from app.workers import run_workers
 
-        dp.include_router(start.router)
-        dp.include_router(account.router)
-        dp.include_router(manage_users.router)
+            print(startup_timer.report())
+            print(f"🤖 Bot is running ({BOT_WORKERS} workers, {RUN_MODE})...")
+            await run_workers(bot, BOT_WORKERS, RUN_MODE)
+            return
+
+        with startup_timer.phase("dispatcher"):
+            dp = create_dispatcher()
 
         # And the run events dispatching
-        print("🤖 Bot is running...")
-        await dp.start_polling(bot)
+        if RUN_MODE == "webhook":
+            from app.webhook import run_webhook
+
+            print(startup_timer.report())
+            print("🤖 Bot is running (webhook)...")
+            await run_webhook(bot, dp)
+        else:
+            # getUpdates is rejected while a webhook is registered
+            with startup_timer.phase("delete_webhook"):
+                await bot.delete_webhook()
+            print(startup_timer.report())
+            print("🤖 Bot is running...")
+            # Stop fetching while the update scheduler is full
+            await dp.start_polling(bot, tasks_concurrency_limit=update_scheduler.max_pending)
 
     except Exception as e:
         print(f"Error in starting the bot: {e}")
@@ -5,65 +5,86 @@ from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
+from app.filters.text_command import ParsedCommand, TextCommand
 from app.models import User
+from app.rendering import Template
 from app.services.user.service import UserService
 
-router = Router()
+router = Router(name="account")
+
+
+ACCOUNT_DETAILS_TEMPLATE = Template(
+    f"""
+{html.underline(html.bold("Account Details"))}
+
+Name: {{name}}
+Email: {{email}}
+Registered On: {{created_at}}
+Last Updated: {{updated_at}}
+"""
+)
+
+NO_ACCOUNT_TEMPLATE = Template(
+    "Hi {name}! 👋\n\nYou don't have an account yet. Please use /start to register."
+)
+
+UPDATE_INSTRUCTIONS = """
+<b>⚡ Update Account Info</b>
+Update Name: <code>update name &lt;your name&gt;</code>
+Update Email: <code>update email &lt;your email&gt;</code>
+
+<b>📝 Example</b>
+<code>update name John Doe</code>
+<code>update email john@example.com</code>
+"""
+
+_update_info_kb = InlineKeyboardBuilder()
+_update_info_kb.button(text="Update Info", callback_data="account_update_info")
+UPDATE_INFO_KEYBOARD = _update_info_kb.as_markup()
 
 
 @router.message(Command("account"))
-async def start_cmd(message: types.Message, state: FSMContext):
+async def start_cmd(message: types.Message, state: FSMContext, user: User | None):
     name = message.from_user.full_name
     tg_user_id = str(message.from_user.id)
     tg_username = message.from_user.username
 
-    # check if user exists, if not create
-    user: User = await UserService.get_user_by_tg_user_id(tg_user_id=tg_user_id)
-
+    # `user` is resolved by AuthMiddleware; None means not registered yet
     if user:
 
-        account_details = f"""
-{html.underline(html.bold("Account Details"))}
-
-Name: {html.code(user.name)}
-Email: {html.code(user.email) if user.email else "N/A"}
-Registered On: {html.code(user.created_at.strftime("%Y-%m-%d %H:%M:%S"))}
-Last Updated: {html.code(user.updated_at.strftime("%Y-%m-%d %H:%M:%S")) if user.updated_at else "N/A"}
-"""
-        kb = InlineKeyboardBuilder()
-        kb.button(text="Update Info", callback_data="account_update_info")
+        account_details = ACCOUNT_DETAILS_TEMPLATE.render(
+            name=html.code(user.name),
+            email=html.code(user.email) if user.email else "N/A",
+            created_at=html.code(user.created_at.strftime("%Y-%m-%d %H:%M:%S")),
+            updated_at=(
+                html.code(user.updated_at.strftime("%Y-%m-%d %H:%M:%S"))
+                if user.updated_at
+                else "N/A"
+            ),
+        )
         await message.answer(
-            text=account_details, parse_mode=ParseMode.HTML, reply_markup=kb.as_markup()
+            text=account_details,
+            parse_mode=ParseMode.HTML,
+            reply_markup=UPDATE_INFO_KEYBOARD,
         )
 
     else:
         await message.answer(
-            f"Hi {html.bold(name)}! 👋\n\nYou don't have an account yet. Please use /start to register.",
+            NO_ACCOUNT_TEMPLATE.render(name=html.bold(name)),
             parse_mode=ParseMode.HTML,
         )
 
 
 @router.callback_query(F.data == "account_update_info")
 async def account_update_info(callback: types.CallbackQuery, state: FSMContext):
-
-    update_instructions = f"""
-<b>⚡ Update Account Info</b>
-Update Name: <code>update name &lt;your name&gt;</code>
-Update Email: <code>update email &lt;your email&gt;</code>
-
-<b>📝 Example</b>
-<code>update name John Doe</code>
-<code>update email john@example.com</code>
-"""
-
-    await callback.message.answer(text=update_instructions, parse_mode=ParseMode.HTML)
+    await callback.message.answer(text=UPDATE_INSTRUCTIONS, parse_mode=ParseMode.HTML)
 
 
 # --- Handle "update name ..."
-@router.message(F.text.lower().startswith("update name "))
-async def update_name(message: types.Message):
+@router.message(TextCommand("update name"))
+async def update_name(message: types.Message, text_command: ParsedCommand):
     tg_user_id = str(message.from_user.id)
-    new_name = message.text[len("update name ") :].strip()
+    new_name = text_command.rest
 
     if not new_name:
         await message.answer("⚠️ Please provide a valid name after `update name`.")
@@ -82,10 +103,12 @@ async def update_name(message: types.Message):
 
 
 # --- Handle "update email ..."
-@router.message(F.text.lower().startswith("update email "))
-async def update_email(message: types.Message):
+@router.message(TextCommand("update email"))
+async def update_email(
+    message: types.Message, text_command: ParsedCommand, user: User | None
+):
     tg_user_id = str(message.from_user.id)
-    new_email = message.text[len("update email ") :].strip()
+    new_email = text_command.rest
 
     if not new_email or "@" not in new_email:
         await message.answer(
@@ -103,21 +126,13 @@ async def update_email(message: types.Message):
         )
         return
 
-    # Check if email already exists in the system
-    existing_user = await UserService.get_user_by_email(email=new_email)
-    if existing_user:
-        if existing_user.tg_user_id == tg_user_id:
-            await message.answer(
-                f"⚠️ You are already registered with this email: {html.bold(existing_user.email)}",
-                parse_mode=ParseMode.HTML,
-            )
-            return
-        else:
-            await message.answer(
-                f"⚠️ This email is already registered by {html.bold(existing_user.name)}.\nPlease enter a different email:",
-                parse_mode=ParseMode.HTML,
-            )
-            return
+    # Uniqueness is enforced by the UPDATE itself, see UserService
+    if user and user.email == new_email:
+        await message.answer(
+            f"⚠️ You are already registered with this email: {html.bold(user.email)}",
+            parse_mode=ParseMode.HTML,
+        )
+        return
 
     try:
         updated_user = await UserService.update_user_details(
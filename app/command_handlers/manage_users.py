@@ -1,93 +1,204 @@
-from aiogram import Router, types, html, F
+import os
+import tempfile
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from asyncpg import PostgresError
+from sqlalchemy.exc import DBAPIError
+from aiogram import Bot, Router, types, html, F
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
-
-from app.models import User
+from aiogram.types import FSInputFile
+
+from app import metrics
+from app.filters.roles import HasPermission
+from app.filters.text_command import ParsedCommand, TextCommand
+from app.permissions import ROLES, Permission
+from app.rendering import Template
+from app.services.broadcast.engine import broadcaster, render_job_status
+from app.services.broadcast.service import BroadcastService
+from app.services.user.cache import user_cache
+from app.services.user.csv_io import export_users_csv, import_users_csv
+from app.services.user.projections import UserListItem
 from app.services.user.service import UserService
 
-router = Router()
+router = Router(name="manage_users")
 
+# Staff handlers only run for callers allowed to view users; everyone else
+# skips the whole router. Handlers needing more add their own permission and,
+# when it's missing, the update falls through to `denied_router`.
+admin_router = Router(name="manage_users.admin")
+admin_router.message.filter(HasPermission(Permission.VIEW_USERS))
+admin_router.callback_query.filter(HasPermission(Permission.VIEW_USERS))
 
-@router.message(Command("manage_users"))
-async def start_cmd(message: types.Message, state: FSMContext):
-    name = message.from_user.full_name
-    tg_user_id = str(message.from_user.id)
-    tg_username = message.from_user.username
+denied_router = Router(name="manage_users.denied")
+
+router.include_routers(admin_router, denied_router)
+
+MAX_PER_PAGE = 50
+SEARCH_LIMIT = 10
+# Ids accepted by one bulk `update role` / `delete user`
+MAX_BULK_IDS = 500
+NOT_FOUND_SHOWN = 20
+STATS_DAYS = 7
+_EPOCH = datetime(1970, 1, 1)
+
+
+class UsersPage(CallbackData, prefix="up"):
+    """
+    Next/Prev button payload for the user list. The keyset cursor is packed as
+    microseconds since epoch + hex uuid to stay inside the 64-byte callback_data.
+    """
+
+    backwards: bool
+    per_page: int
+    ts: int
+    id: str
+
+    @classmethod
+    def from_user(cls, user: UserListItem, per_page: int, backwards: bool) -> "UsersPage":
+        ts = (user.created_at.replace(tzinfo=None) - _EPOCH) // timedelta(microseconds=1)
+        return cls(backwards=backwards, per_page=per_page, ts=ts, id=user.id.hex)
+
+    @property
+    def cursor(self) -> tuple[datetime, UUID]:
+        return _EPOCH + timedelta(microseconds=self.ts), UUID(hex=self.id)
+
+
+def render_users_page(
+    users: list[UserListItem], per_page: int, has_prev: bool, has_next: bool
+) -> tuple[str, types.InlineKeyboardMarkup | None]:
+    response = "\n".join(
+        [
+            f"👤 {u.name or '-'} | @{u.tg_username or '-'} | Role: {u.role or '-'} | ID: {u.tg_user_id}"
+            for u in users
+        ]
+    )
+
+    kb = InlineKeyboardBuilder()
+    if has_prev:
+        kb.button(
+            text="⬅️ Prev",
+            callback_data=UsersPage.from_user(users[0], per_page, backwards=True),
+        )
+    if has_next:
+        kb.button(
+            text="Next ➡️",
+            callback_data=UsersPage.from_user(users[-1], per_page, backwards=False),
+        )
+
+    return response, kb.as_markup() if (has_prev or has_next) else None
 
-    # check if user exists, if not create
-    user: User = await UserService.get_user_by_tg_user_id(tg_user_id=tg_user_id)
 
-    if user:
-        if user.role == "admin":
-            admin_message = f"""
+ADMIN_INSTRUCTIONS = f"""
 ⚙️ <b>Admin Manage User Instructions</b>
 
-1. Get User List: <code>get users &lt;page&gt; &lt;per_page&gt;</code>
+1. Get User List: <code>get users &lt;per_page&gt;</code>
 2. Get User: <code>get user &lt;userId&gt;</code>
-3. Update User Role: <code>update role &lt;userId&gt; &lt;role&gt;</code>
-4. Delete User: <code>delete user &lt;userId&gt;</code>
+3. Update User Role: <code>update role &lt;userId&gt; [&lt;userId&gt; ...] &lt;role&gt;</code> ({", ".join(ROLES)})
+4. Delete User: <code>delete user &lt;userId&gt; [&lt;userId&gt; ...]</code>
+5. Find User: <code>find user &lt;name, email or username&gt;</code>
+6. Broadcast: <code>broadcast &lt;message&gt;</code> / <code>broadcast status</code>
+7. Export Users (CSV): <code>export users</code>
+8. Import Users (CSV): send a .csv file with caption <code>import users</code>
+9. Bot Stats: /stats
+10. User Stats: <code>user stats</code>
 
 <b>Example Commands</b>
 
-1. Get User List: <code>get users 1 10</code>
+1. Get User List: <code>get users 10</code>
 2. Update User Role: <code>update role 1234567890 admin</code>
 3. Get User: <code>get user 1234567890</code>
 4. Delete User: <code>delete user 1234567890</code>
+5. Find User: <code>find user john</code>
+6. Bulk Update Roles: <code>update roles 1234567890 1234567891 moderator</code>
+7. Bulk Delete: <code>delete users 1234567890 1234567891 1234567892</code>
 """
 
-            await message.answer(admin_message, parse_mode=ParseMode.HTML)
-
-        else:
-            await message.answer("You are not authorized to use this command.")
-    else:
-        await message.answer("You are not authorized to use this command.")
+USER_DETAILS_TEMPLATE = Template(
+    """
+<b>User Details</b>
+- Name: <code>{name}</code>
+- Email: <code>{email}</code>
+- Role: <code>{role}</code>
+- Registered: <code>{created_at}</code>
+- Last Updated: <code>{updated_at}</code>
+"""
+)
 
 
-@router.message(F.text.startswith("get users"))
-async def get_users(message: types.Message):
-    tg_user_id = str(message.from_user.id)
-    user: User = await UserService.get_user_by_tg_user_id(tg_user_id=tg_user_id)
+@admin_router.message(Command("manage_users"))
+async def start_cmd(message: types.Message, state: FSMContext):
+    await message.answer(ADMIN_INSTRUCTIONS, parse_mode=ParseMode.HTML)
 
-    if not user or user.role != "admin":
-        await message.answer("You are not authorized to use this command.")
-        return
 
+@admin_router.message(TextCommand("get users"))
+async def get_users(message: types.Message, text_command: ParsedCommand):
+    # "get users [per_page]"; the legacy "get users <page> <per_page>" form is
+    # still accepted and jumps to that page once, then continues by cursor.
     try:
-        _, _, page, per_page = message.text.split()
-        page, per_page = int(page), int(per_page)
+        args = [int(arg) for arg in text_command.args]
+        if not args:
+            page, per_page = 1, 10
+        elif len(args) == 1:
+            page, per_page = 1, args[0]
+        else:
+            page, per_page = args
+        if page < 1 or per_page < 1:
+            raise ValueError
     except ValueError:
         await message.answer(
-            "❌ Usage: `get users <page> <per_page>`", parse_mode=ParseMode.MARKDOWN
+            "❌ Usage: `get users <per_page>`", parse_mode=ParseMode.MARKDOWN
         )
         return
 
-    users = await UserService.get_all_users_paginated(page, per_page)
+    per_page = min(per_page, MAX_PER_PAGE)
+
+    if page == 1:
+        users, has_next = await UserService.get_users_page(per_page)
+    else:
+        users = await UserService.get_all_users_paginated(
+            offset=(page - 1) * per_page, limit=per_page + 1
+        )
+        has_next = len(users) > per_page
+        users = users[:per_page]
+
     if not users:
         await message.answer("No users found.")
         return
 
-    response = "\n".join(
-        [
-            f"👤 {u.name or '-'} | @{u.tg_username or '-'} | Role: {u.role or '-'} | ID: {u.tg_user_id}"
-            for u in users
-        ]
-    )
-    await message.answer(response)
+    response, markup = render_users_page(users, per_page, page > 1, has_next)
+    await message.answer(response, reply_markup=markup)
 
 
-@router.message(F.text.startswith("get user"))
-async def get_user(message: types.Message):
-    tg_user_id = str(message.from_user.id)
-    user: User = await UserService.get_user_by_tg_user_id(tg_user_id=tg_user_id)
+@admin_router.callback_query(UsersPage.filter())
+async def get_users_page(callback: types.CallbackQuery, callback_data: UsersPage):
+    per_page = min(callback_data.per_page, MAX_PER_PAGE)
+    users, has_more = await UserService.get_users_page(
+        per_page, cursor=callback_data.cursor, backwards=callback_data.backwards
+    )
 
-    if not user or user.role != "admin":
-        await message.answer("You are not authorized to use this command.")
+    if not users:
+        await callback.answer("No more users.")
         return
 
+    if callback_data.backwards:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = True, has_more
+
+    response, markup = render_users_page(users, per_page, has_prev, has_next)
+    await callback.message.edit_text(response, reply_markup=markup)
+    await callback.answer()
+
+
+@admin_router.message(TextCommand("get user"))
+async def get_user(message: types.Message, text_command: ParsedCommand):
     try:
-        _, _, target_tg_id = message.text.split()
+        (target_tg_id,) = text_command.args
     except ValueError:
         await message.answer(
             "❌ Usage: `get user <tg_user_id>`", parse_mode=ParseMode.MARKDOWN
@@ -99,69 +210,265 @@ async def get_user(message: types.Message):
         await message.answer("User not found.")
         return
 
-    details = f"""
-<b>User Details</b>
-- Name: <code>{user.name}</code>
-- Email: <code>{user.email or "N/A"}</code>
-- Role: <code>{user.role}</code>
-- Registered: <code>{user.created_at.strftime("%Y-%m-%d %H:%M:%S")}</code>
-- Last Updated: <code>{user.updated_at.strftime("%Y-%m-%d %H:%M:%S") if user.updated_at else "N/A"}</code>
-"""
+    details = USER_DETAILS_TEMPLATE.render(
+        name=html.quote(target_user.name),
+        email=html.quote(target_user.email or "N/A"),
+        role=html.quote(target_user.role),
+        created_at=target_user.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        updated_at=(
+            target_user.updated_at.strftime("%Y-%m-%d %H:%M:%S")
+            if target_user.updated_at
+            else "N/A"
+        ),
+    )
     await message.answer(details, parse_mode=ParseMode.HTML)
 
 
-@router.message(F.text.startswith("update role"))
-async def update_role(message: types.Message):
-    tg_user_id = str(message.from_user.id)
-    user: User = await UserService.get_user_by_tg_user_id(tg_user_id=tg_user_id)
+@admin_router.message(TextCommand("find user"))
+async def find_user(message: types.Message, text_command: ParsedCommand):
+    text = text_command.rest
 
-    if not user or user.role != "admin":
-        await message.answer("You are not authorized to use this command.")
+    if not text:
+        await message.answer(
+            "❌ Usage: `find user <name, email or username>`",
+            parse_mode=ParseMode.MARKDOWN,
+        )
         return
 
-    try:
-        _, _, target_tg_id, role = message.text.split()
-    except ValueError:
+    users = await UserService.search_users(text, limit=SEARCH_LIMIT)
+    if not users:
+        await message.answer("No matching users found.")
+        return
+
+    response = "\n".join(
+        [
+            f"👤 {u.name or '-'} | {u.email or '-'} | @{u.tg_username or '-'} | ID: {u.tg_user_id}"
+            for u in users
+        ]
+    )
+    await message.answer(response)
+
+
+@admin_router.message(
+    TextCommand("update role", "update roles"), HasPermission(Permission.MANAGE_ROLES)
+)
+async def update_role(message: types.Message, text_command: ParsedCommand):
+    # "update role <tg_user_id> [<tg_user_id> ...] <role>"
+    *target_tg_ids, role = text_command.args or [None]
+    if not target_tg_ids or len(target_tg_ids) > MAX_BULK_IDS:
         await message.answer(
-            "❌ Usage: `update role <tg_user_id> <role>`", parse_mode=ParseMode.MARKDOWN
+            f"❌ Usage: `update role <tg_user_id> [<tg_user_id> ...] <role>` "
+            f"(up to {MAX_BULK_IDS} users)",
+            parse_mode=ParseMode.MARKDOWN,
         )
         return
 
     try:
-        updated_user = await UserService.admin_update_user_role(
-            tg_user_id=str(target_tg_id), role=role
-        )
+        if len(target_tg_ids) == 1:
+            updated_user = await UserService.admin_update_user_role(
+                tg_user_id=str(target_tg_ids[0]), role=role
+            )
+            await message.answer(
+                f"✅ Updated role for @{updated_user.tg_username} → {role}"
+            )
+            return
+
+        updated = await UserService.admin_update_users_role(target_tg_ids, role)
         await message.answer(
-            f"✅ Updated role for @{updated_user.tg_username} → {role}"
+            f"✅ Updated role for {len(updated)} user(s) → {role}"
+            + _not_found_note(target_tg_ids, updated)
         )
     except ValueError as e:
         await message.answer(f"❌ {str(e)}")
 
 
-@router.message(F.text.startswith("delete user"))
-async def delete_user(message: types.Message):
+@admin_router.message(
+    TextCommand("delete user", "delete users"), HasPermission(Permission.DELETE_USERS)
+)
+async def delete_user(message: types.Message, text_command: ParsedCommand):
     tg_user_id = str(message.from_user.id)
-    user: User = await UserService.get_user_by_tg_user_id(tg_user_id=tg_user_id)
+    target_tg_ids = text_command.args
+
+    if not target_tg_ids or len(target_tg_ids) > MAX_BULK_IDS:
+        await message.answer(
+            f"❌ Usage: `delete user <tg_user_id> [<tg_user_id> ...]` (up to {MAX_BULK_IDS} users)",
+            parse_mode=ParseMode.MARKDOWN,
+        )
+        return
 
-    if not user or user.role != "admin":
-        await message.answer("You are not authorized to use this command.")
+    if tg_user_id in target_tg_ids:
+        await message.answer("⚠️ Admin can't delete his/her own account.")
         return
 
     try:
-        _, _, target_tg_id = message.text.split()
-    except ValueError:
+        if len(target_tg_ids) == 1:
+            success = await UserService.delete_user(target_tg_ids[0])
+            if success:
+                await message.answer(f"✅ User {target_tg_ids[0]} deleted successfully.")
+            return
+
+        deleted = await UserService.delete_users(target_tg_ids)
+        await message.answer(
+            f"✅ Deleted {len(deleted)} user(s)." + _not_found_note(target_tg_ids, deleted)
+        )
+    except ValueError as e:
+        await message.answer(f"❌ {str(e)}")
+
+
+def _not_found_note(requested: list[str], done: list[str]) -> str:
+    missing = sorted(set(requested) - set(done))
+    if not missing:
+        return ""
+    shown = ", ".join(missing[:NOT_FOUND_SHOWN])
+    more = f" and {len(missing) - NOT_FOUND_SHOWN} more" if len(missing) > NOT_FOUND_SHOWN else ""
+    return f"\nNot found: {shown}{more}"
+
+
+@admin_router.message(TextCommand("broadcast"), HasPermission(Permission.BROADCAST))
+async def broadcast(message: types.Message, text_command: ParsedCommand, bot: Bot):
+    text = text_command.rest
+
+    if not text:
         await message.answer(
-            "❌ Usage: `delete user <tg_user_id>`", parse_mode=ParseMode.MARKDOWN
+            "❌ Usage: `broadcast <message>`", parse_mode=ParseMode.MARKDOWN
         )
         return
 
-    if target_tg_id == tg_user_id:
-        await message.answer("⚠️ Admin can't delete his/her own account.")
+    if text == "status":
+        job = await BroadcastService.get_latest_job()
+        if not job:
+            await message.answer("No broadcasts yet.")
+            return
+        await message.answer(render_job_status(job), parse_mode=ParseMode.HTML)
         return
 
+    job = await broadcaster.start(bot, created_by=str(message.from_user.id), text=text)
+    await message.answer(
+        f"📣 Broadcast {html.code(str(job.id)[:8])} started. "
+        f"You'll get a report when it's done (or use <code>broadcast status</code>).",
+        parse_mode=ParseMode.HTML,
+    )
+
+
+@admin_router.message(TextCommand("export users"), HasPermission(Permission.EXPORT_USERS))
+async def export_users(message: types.Message):
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        rows, rows_per_sec = await export_users_csv(path)
+        await message.answer_document(
+            FSInputFile(path, filename="users.csv"),
+            caption=f"📤 Exported {rows} users ({rows_per_sec:,.0f} rows/s)",
+        )
+    finally:
+        os.remove(path)
+
+
+@admin_router.message(F.document, TextCommand("import users"), HasPermission(Permission.IMPORT_USERS))
+async def import_users(message: types.Message, bot: Bot):
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
     try:
-        success = await UserService.delete_user(target_tg_id)
-        if success:
-            await message.answer(f"✅ User {target_tg_id} deleted successfully.")
+        await bot.download(message.document, destination=path)
+        result = await import_users_csv(path)
     except ValueError as e:
         await message.answer(f"❌ {str(e)}")
+        return
+    except (PostgresError, DBAPIError) as e:
+        # Malformed rows are rejected by COPY / the casts in the upsert
+        await message.answer(f"❌ Import failed: {str(e).splitlines()[0]}")
+        return
+    finally:
+        os.remove(path)
+
+    await message.answer(
+        f"📥 Imported {result['rows']} rows ({result['rows_per_sec']:,.0f} rows/s)\n"
+        f"Inserted: {result['inserted']}, Updated: {result['updated']}, Skipped: {result['skipped']}"
+    )
+
+
+def _avg(histogram: metrics.Histogram, *labels: str) -> float:
+    count, total = histogram.summary(*labels)
+    return total / count if count else 0.0
+
+
+@admin_router.message(Command("stats"), HasPermission(Permission.VIEW_STATS))
+async def stats(message: types.Message):
+    updates, _ = metrics.update_latency.summary()
+    api_calls = sum(
+        metrics.bot_api_latency.summary(*labels)[0]
+        for labels in metrics.bot_api_latency.values
+    )
+    api_errors = sum(metrics.bot_api_errors.values.values())
+    cache = user_cache.stats()
+
+    slowest = sorted(
+        metrics.handler_latency.values,
+        key=lambda labels: _avg(metrics.handler_latency, *labels),
+        reverse=True,
+    )[:5]
+    handler_lines = "\n".join(
+        f"- {router} / {handler}: <code>{_avg(metrics.handler_latency, router, handler) * 1000:.1f} ms</code>"
+        for router, handler in slowest
+    )
+
+    details = f"""
+📊 <b>Bot Stats</b>
+
+Updates: <code>{updates}</code> (avg <code>{_avg(metrics.update_latency) * 1000:.1f} ms</code>)
+DB queries/update: <code>{_avg(metrics.db_queries_per_update):.2f}</code> (avg <code>{_avg(metrics.db_time_per_update) * 1000:.1f} ms</code>)
+Pool checkout wait: <code>{_avg(metrics.pool_checkout_wait) * 1000:.1f} ms</code>
+Bot API calls: <code>{api_calls}</code>, errors: <code>{int(api_errors)}</code>
+User cache: <code>{cache["hits"]}</code> hits / <code>{cache["misses"]}</code> misses / <code>{cache["evictions"]}</code> evictions
+
+<b>Slowest handlers (avg)</b>
+{handler_lines or "N/A"}
+"""
+    await message.answer(details, parse_mode=ParseMode.HTML)
+
+
+USER_STATS_TEMPLATE = Template(
+    """
+👥 <b>User Stats</b>
+
+Total: <code>{total}</code>
+Deleted (pending purge): <code>{deleted}</code>
+
+<b>By role</b>
+{roles}
+
+<b>Registrations (last {days} days)</b>
+{registrations}
+"""
+)
+
+
+@admin_router.message(TextCommand("user stats"), HasPermission(Permission.VIEW_STATS))
+async def user_stats(message: types.Message):
+    stats = await UserService.get_user_stats(days=STATS_DAYS)
+
+    roles = "\n".join(
+        f"{html.quote(role)}: <code>{count}</code>" for role, count in stats["roles"].items()
+    )
+    registrations = "\n".join(
+        f"{day:%Y-%m-%d}: <code>{count}</code>" for day, count in stats["registrations"]
+    )
+    details = USER_STATS_TEMPLATE.render(
+        total=stats["total"],
+        deleted=stats["deleted"],
+        roles=roles or "N/A",
+        days=STATS_DAYS,
+        registrations=registrations,
+    )
+    await message.answer(details, parse_mode=ParseMode.HTML)
+
+
+@denied_router.message(Command("manage_users", "stats"))
+@denied_router.message(
+    TextCommand(
+        "get users", "get user", "find user", "update role", "update roles",
+        "delete user", "delete users", "broadcast", "export users", "user stats",
+    )
+)
+async def not_authorized(message: types.Message):
+    await message.answer("You are not authorized to use this command.")
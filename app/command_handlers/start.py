@@ -7,9 +7,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
 from app.models import User
-from app.services.user.service import UserService
+from app.permissions import Permission, has_permission
+from app.rendering import Template, join_messages
+from app.services.user.service import EMAIL_IN_USE, UserService
 
-router = Router()
+router = Router(name="start")
 
 
 # Define states for registration
@@ -18,16 +20,12 @@ class Registration(StatesGroup):
     waiting_for_email = State()
 
 
-@router.message(Command("start"))
-async def start_cmd(message: types.Message, state: FSMContext):
-    name = message.from_user.full_name
-    tg_user_id = str(message.from_user.id)
-    tg_username = message.from_user.username
-
-    welcome_message = f"""
+# Static parts are rendered once at import; only the names are filled per call
+WELCOME_TEMPLATE = Template(
+    f"""
 {html.bold("⚡ArivuTechBot Activated!")}
 
-Hi {html.bold(name)}! 👋
+Hi {{name}}! 👋
 
 {html.bold("What you're experiencing:")}
 🏗️  Enterprise-Grade Architecture
@@ -41,43 +39,57 @@ Hi {html.bold(name)}! 👋
 
 Built with ❤️ by {html.bold("Arivu")} to showcase professional development standards.
 """
-    await message.answer(welcome_message, parse_mode=ParseMode.HTML)
-
-    # check if user exists, if not create
-    user = await UserService.get_user_by_tg_user_id(tg_user_id=tg_user_id)
+)
 
-    if user:
+WELCOME_BACK_TEMPLATE = Template("Welcome back, {role} {name}!")
 
-        await message.answer(
-            f"Welcome back, {user.role} {html.bold(user.name)}!",
-            parse_mode=ParseMode.HTML,
-        )
+NEW_USER_TEMPLATE = Template("You are new here, {name}! \n\nClick below to register 👇")
 
-        if user.role == "admin":
-            admin_message = f"""
+ADMIN_COMMANDS = f"""
 ⚙️ {html.bold("Admin Commands")}
 
 👤 /account - Manage your account
 👥 /manage_users - Manage users
 """
-            await message.answer(admin_message, parse_mode=ParseMode.HTML)
 
-        else:
-            user_message = f"""
+USER_COMMANDS = f"""
 ⚙️ {html.bold("User Commands")}
 
 👤 /account - Manage your account
 """
-            await message.answer(user_message, parse_mode=ParseMode.HTML)
+
+_register_kb = InlineKeyboardBuilder()
+_register_kb.button(text="Register", callback_data="register_start")
+REGISTER_KEYBOARD = _register_kb.as_markup()
+
+
+@router.message(Command("start"))
+async def start_cmd(message: types.Message, state: FSMContext, user: User | None):
+    name = message.from_user.full_name
+    tg_user_id = str(message.from_user.id)
+    tg_username = message.from_user.username
+
+    welcome_message = WELCOME_TEMPLATE.render(name=html.bold(name))
+
+    # `user` is resolved by AuthMiddleware; None means not registered yet.
+    # Everything goes out as a single message (one Bot API call) when it fits.
+    if user:
+        parts = join_messages(
+            welcome_message,
+            WELCOME_BACK_TEMPLATE.render(role=user.role, name=html.bold(user.name)),
+            ADMIN_COMMANDS if has_permission(user, Permission.VIEW_USERS) else USER_COMMANDS,
+        )
+        reply_markup = None
 
     else:
-        kb = InlineKeyboardBuilder()
-        kb.button(text="Register", callback_data="register_start")
-        await message.answer(
-            f"You are new here, {html.bold(name)}! \n\nClick below to register 👇",
-            parse_mode=ParseMode.HTML,
-            reply_markup=kb.as_markup(),
+        parts = join_messages(
+            welcome_message, NEW_USER_TEMPLATE.render(name=html.bold(name))
         )
+        reply_markup = REGISTER_KEYBOARD
+
+    for part in parts[:-1]:
+        await message.answer(part, parse_mode=ParseMode.HTML)
+    await message.answer(parts[-1], parse_mode=ParseMode.HTML, reply_markup=reply_markup)
 
 
 @router.callback_query(F.data == "register_start")
@@ -112,22 +124,22 @@ async def process_email(message: types.Message, state: FSMContext):
         )
         return
 
-    # Check if email already exists in the system
-    existing_user = await UserService.get_user_by_email(email=email)
-    if existing_user:
-        await message.answer(
-            f"⚠️ This email is already registered by {html.bold(existing_user.name)}.\nPlease enter a different email:"
+    # Save to DB; a taken email or an existing account is reported by the INSERT
+    try:
+        user: User = await UserService.create_user(
+            tg_user_id=tg_user_id,
+            tg_username=tg_username,
+            name=data["name"],
+            email=email,
         )
+    except ValueError as e:
+        if str(e) == EMAIL_IN_USE:
+            await message.answer(f"⚠️ {str(e)}.\nPlease enter a different email:")
+        else:
+            await message.answer(f"⚠️ {str(e)}.")
+            await state.clear()
         return
 
-    # Save to DB
-    user: User = await UserService.create_user(
-        tg_user_id=tg_user_id,
-        tg_username=tg_username,
-        name=data["name"],
-        email=email,
-    )
-
     await message.answer(
         f"🎉 Registration complete!\n\nWelcome, {html.bold(user.name)}!\nYour email: {html.bold(user.email)}",
         parse_mode=ParseMode.HTML,
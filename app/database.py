@@ -1,20 +1,64 @@
-from typing import AsyncGenerator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncGenerator, AsyncIterator
 import os
+import time
 from dotenv import load_dotenv
 
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.metrics import InstrumentedPool, db_reads_total, instrument_engine
+
 load_dotenv()
-DB_URL = f"postgresql+asyncpg://{os.getenv('DATABASE_USER')}:{os.getenv('DATABASE_PASSWORD')}@{os.getenv('DATABASE_HOST')}:{os.getenv('DATABASE_PORT')}/{os.getenv('DATABASE_NAME')}"
+DB_CREDENTIALS = f"{os.getenv('DATABASE_USER')}:{os.getenv('DATABASE_PASSWORD')}"
+DB_URL = f"postgresql+asyncpg://{DB_CREDENTIALS}@{os.getenv('DATABASE_HOST')}:{os.getenv('DATABASE_PORT')}/{os.getenv('DATABASE_NAME')}"
 
-async_engine = create_async_engine(
-    url=DB_URL,
-    echo=False,
-    future=True,
-    connect_args={"server_settings": {"application_name": "ArivuTechBot"}},
-)
+# Connection pool per engine (primary and each replica)
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+# Prepared statements cached per connection; set 0 behind pgbouncer (transaction mode)
+DATABASE_STATEMENT_CACHE_SIZE = int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", "100"))
+
+# Optional read replicas: comma-separated "host[:port][/database]", sharing the
+# primary's credentials (and port/database when omitted)
+DATABASE_REPLICAS = os.getenv("DATABASE_REPLICAS", "")
+# Reads of a key written by this process go to the primary for this long
+REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+# A replica that failed is skipped for this long
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url=f"{url}?prepared_statement_cache_size={DATABASE_STATEMENT_CACHE_SIZE}",
+        echo=False,
+        future=True,
+        connect_args={
+            "server_settings": {"application_name": "ArivuTechBot"},
+            "statement_cache_size": DATABASE_STATEMENT_CACHE_SIZE,
+        },
+        poolclass=InstrumentedPool,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+    )
+    instrument_engine(engine)
+    return engine
+
+
+def _replica_url(spec: str) -> str:
+    address, _, database = spec.strip().partition("/")
+    host, _, port = address.partition(":")
+    port = port or os.getenv("DATABASE_PORT")
+    database = database or os.getenv("DATABASE_NAME")
+    return f"postgresql+asyncpg://{DB_CREDENTIALS}@{host}:{port}/{database}"
+
+
+async_engine = _create_engine(DB_URL)
 
 SessionLocal = sessionmaker(
     bind=async_engine,
@@ -25,7 +69,172 @@ SessionLocal = sessionmaker(
 )
 
 
+class ReplicaRouter:
+    """
+    Picks the engine for a read: replicas round-robin, except for keys
+    written within `pin_seconds` and replicas that recently failed, which fall
+    back to the primary. Keys are pinned by this process's own writes
+    (read-your-own-writes) and by other processes' writes as their cache
+    invalidations arrive, so a lagging replica can't refill the cache with the
+    row just invalidated.
+    """
+
+    # Expired pins are pruned once this many have accumulated
+    MAX_PINS = 10000
+
+    def __init__(
+        self,
+        replicas: list[AsyncEngine],
+        pin_seconds: float = REPLICA_PIN_SECONDS,
+        retry_seconds: float = REPLICA_RETRY_SECONDS,
+    ):
+        self.replicas = replicas
+        self.pin_seconds = pin_seconds
+        self.retry_seconds = retry_seconds
+        self._next = 0
+        self._pinned_until: dict[str, float] = {}
+        self._all_pinned_until = 0.0
+        self._down_until: dict[AsyncEngine, float] = {}
+
+    def pin(self, *keys: str | None) -> None:
+        if not self.replicas:
+            return
+        until = time.monotonic() + self.pin_seconds
+        for key in keys:
+            if key is not None:
+                self._pinned_until[key] = until
+
+        if len(self._pinned_until) > self.MAX_PINS:
+            now = time.monotonic()
+            self._pinned_until = {
+                key: until for key, until in self._pinned_until.items() if until > now
+            }
+
+    def pin_all(self) -> None:
+        """Pin every key, e.g. after a bulk write touching unknown users."""
+        if self.replicas:
+            self._all_pinned_until = time.monotonic() + self.pin_seconds
+
+    def is_pinned(self, key: str | None) -> bool:
+        if not self.replicas:
+            return False
+        now = time.monotonic()
+        if self._all_pinned_until > now:
+            return True
+        return key is not None and self._pinned_until.get(key, 0) > now
+
+    def pick(self, key: str | None = None) -> AsyncEngine | None:
+        """A replica to read `key` from, or None for the primary."""
+        if not self.replicas or self.is_pinned(key):
+            return None
+
+        now = time.monotonic()
+
+        for _ in range(len(self.replicas)):
+            engine = self.replicas[self._next]
+            self._next = (self._next + 1) % len(self.replicas)
+            if self._down_until.get(engine, 0) <= now:
+                return engine
+        return None
+
+    def mark_down(self, engine: AsyncEngine, error: Exception) -> None:
+        print(f"Replica {engine.url.host} unavailable, reading from primary: {error}")
+        self._down_until[engine] = time.monotonic() + self.retry_seconds
+
+
+replica_router = ReplicaRouter(
+    [_create_engine(_replica_url(spec)) for spec in DATABASE_REPLICAS.split(",") if spec.strip()]
+)
+
+
+class UnitOfWork:
+    """
+    DB scope of one update (see UnitOfWorkMiddleware). Every `db_session()`
+    inside it shares one session bound to one connection, checked out of the
+    pool on first use only. Service methods still commit their own writes, which
+    keeps the connection; the scope commits or rolls back whatever is left and
+    returns the connection when the update is done, or earlier on `release()`.
+    """
+
+    def __init__(self):
+        self._connection: AsyncConnection | None = None
+        self._session: AsyncSession | None = None
+        # Set once a write path used the scope; later reads stay on the primary
+        self.wrote = False
+
+    async def session(self) -> AsyncSession:
+        if self._session is None:
+            self._connection = await async_engine.connect()
+            self._session = SessionLocal(bind=self._connection)
+        return self._session
+
+    async def close(self, commit: bool) -> None:
+        if self._session is None:
+            return
+        session, connection = self._session, self._connection
+        self._session = self._connection = None
+        try:
+            if commit:
+                await session.commit()
+            else:
+                await session.rollback()
+        finally:
+            await session.close()
+            await connection.close()
+
+    async def release(self) -> None:
+        """
+        End the open (read) transaction and return the connection before slow
+        network I/O, so it isn't held idle in transaction meanwhile; the next
+        query checks out a connection again.
+        """
+        await self.close(commit=True)
+
+
+current_unit_of_work: ContextVar[UnitOfWork | None] = ContextVar(
+    "current_unit_of_work", default=None
+)
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[UnitOfWork]:
+    uow = UnitOfWork()
+    token = current_unit_of_work.set(uow)
+    try:
+        yield uow
+    except BaseException:
+        await uow.close(commit=False)
+        raise
+    else:
+        await uow.close(commit=True)
+    finally:
+        current_unit_of_work.reset(token)
+
+
+def detach_unit_of_work() -> None:
+    """
+    Run the rest of the current context without a unit of work. Call it at the
+    start of background tasks spawned from a handler, which must not share (or
+    outlive) the update's session.
+    """
+    current_unit_of_work.set(None)
+
+
+async def _unit_of_work_session(uow: UnitOfWork) -> AsyncGenerator:
+    # Errors in the caller's loop body never reach the generator: the unit of
+    # work rolls back when the update fails, savepoints (`begin_nested`) undo
+    # failed writes that are handled
+    yield await uow.session()
+
+
 async def db_session() -> AsyncGenerator:
+    uow = current_unit_of_work.get()
+    if uow is not None:
+        uow.wrote = True
+        async for session in _unit_of_work_session(uow):
+            yield session
+        return
+
     async with SessionLocal() as session:
         try:
             yield session
@@ -34,3 +243,45 @@ async def db_session() -> AsyncGenerator:
             raise e
         finally:
             await session.close()
+
+
+async def read_session(key: str | None = None) -> AsyncGenerator:
+    """
+    Like `db_session`, but for read-only work that may run on a replica.
+    `key` (e.g. a tg_user_id) keeps reads of rows this process just wrote on
+    the primary, see `replica_router.pin`.
+    """
+    uow = current_unit_of_work.get()
+    engine = None if uow is not None and uow.wrote else replica_router.pick(key)
+    if engine is None:
+        db_reads_total.inc("primary")
+        if uow is not None:
+            async for session in _unit_of_work_session(uow):
+                yield session
+            return
+        async for session in db_session():
+            yield session
+        return
+
+    session = SessionLocal(bind=engine)
+    try:
+        # Check a connection out now, so an unreachable replica falls back
+        # to the primary instead of failing the caller
+        await session.connection()
+    except (OSError, DBAPIError) as e:
+        await session.close()
+        replica_router.mark_down(engine, e)
+        db_reads_total.inc("fallback")
+        async for session in db_session():
+            yield session
+        return
+
+    db_reads_total.inc("replica")
+    async with session:
+        try:
+            yield session
+        except Exception as e:
+            if isinstance(e, DBAPIError) and e.connection_invalidated:
+                replica_router.mark_down(engine, e)
+            await session.rollback()
+            raise e
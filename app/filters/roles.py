@@ -0,0 +1,18 @@
+from aiogram.filters import Filter
+from aiogram.types import TelegramObject
+
+from app.models import User
+from app.permissions import Permission, has_permission
+
+
+class HasPermission(Filter):
+    """
+    Passes only when the `user` injected by AuthMiddleware has `permission`.
+    No DB access: the user comes from the cache, the role mask from memory.
+    """
+
+    def __init__(self, permission: Permission):
+        self.permission = permission
+
+    async def __call__(self, event: TelegramObject, user: User | None = None) -> bool:
+        return has_permission(user, self.permission)
@@ -0,0 +1,89 @@
+"""
+Free-text commands such as "get user 123" or "update email a@b.c".
+
+Every phrase used in a `TextCommand` filter is added to one word trie. A
+message is tokenized once per update (see TextCommandMiddleware) and looked up
+in the trie; the filters then only compare the matched name. Text that isn't a
+command stops at the first word.
+"""
+
+from typing import NamedTuple
+
+from aiogram.filters import Filter
+from aiogram.types import Message, TelegramObject
+
+# Marks the end of a phrase in a trie node
+_END = ""
+
+
+class ParsedCommand(NamedTuple):
+    name: str
+    # Whitespace-separated arguments after the command words
+    args: list[str]
+    # Everything after the command words, as typed (e.g. a broadcast message)
+    rest: str
+
+
+class CommandTrie:
+    """Word trie of command phrases, matched case-insensitively, longest first."""
+
+    def __init__(self):
+        self.root: dict = {}
+        self.depth = 0
+
+    def add(self, phrase: str) -> str:
+        words = phrase.lower().split()
+        node = self.root
+        for word in words:
+            node = node.setdefault(word, {})
+        node[_END] = " ".join(words)
+        self.depth = max(self.depth, len(words))
+        return node[_END]
+
+    def match(self, text: str | None) -> ParsedCommand | None:
+        if not text:
+            return None
+
+        words = text.split(None, self.depth)
+        node = self.root
+        name, length = None, 0
+        for i, word in enumerate(words[: self.depth]):
+            node = node.get(word.lower())
+            if node is None:
+                break
+            if _END in node:
+                name, length = node[_END], i + 1
+        if name is None:
+            return None
+
+        parts = text.split(None, length)
+        rest = parts[length].strip() if len(parts) > length else ""
+        return ParsedCommand(name, rest.split(), rest)
+
+
+text_commands = CommandTrie()
+
+
+def parse_text_command(message: Message, data: dict) -> ParsedCommand | None:
+    """
+    The message's text command, matched once per update and kept in `data`
+    as `text_command` for every middleware, filter and handler after it.
+    """
+    if "text_command" not in data:
+        data["text_command"] = text_commands.match(message.text or message.caption)
+    return data["text_command"]
+
+
+class TextCommand(Filter):
+    """
+    Passes when the message is one of the given command phrases, e.g.
+    `TextCommand("get user")`. Handlers get the match as `text_command`.
+    """
+
+    def __init__(self, *phrases: str):
+        self.names = frozenset(text_commands.add(phrase) for phrase in phrases)
+
+    async def __call__(
+        self, event: TelegramObject, text_command: ParsedCommand | None = None
+    ) -> bool:
+        return text_command is not None and text_command.name in self.names
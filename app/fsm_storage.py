@@ -0,0 +1,231 @@
+import asyncio
+import os
+from datetime import timedelta
+from typing import Any, Dict, Mapping, Optional
+from dotenv import load_dotenv
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import case, delete, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.database import async_engine
+from app.models import FSMRecord
+
+load_dotenv()
+# "memory" (default, single process) or "postgres" (survives restarts, shared)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))
+FSM_CLEANUP_INTERVAL = int(os.getenv("FSM_CLEANUP_INTERVAL", "300"))
+FSM_CLEANUP_BATCH = int(os.getenv("FSM_CLEANUP_BATCH", "1000"))
+
+fsm_table = FSMRecord.__table__
+EMPTY_JSONB = literal_column("'{}'::jsonb")
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM storage backed by the `fsm_states` table, so flows survive restarts and
+    can be shared by several bot processes.
+
+    Every write pushes `expires_at` forward by `ttl`; expired rows read as empty
+    and are removed in batches by a background cleanup task.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine = async_engine,
+        key_builder: KeyBuilder | None = None,
+        ttl: int = FSM_TTL,
+        cleanup_interval: int = FSM_CLEANUP_INTERVAL,
+        cleanup_batch: int = FSM_CLEANUP_BATCH,
+    ) -> None:
+        self.engine = engine
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.ttl = timedelta(seconds=ttl)
+        self.cleanup_interval = cleanup_interval
+        self.cleanup_batch = cleanup_batch
+        self._cleanup_task: asyncio.Task | None = None
+
+    def _expires_at(self):
+        return func.now() + self.ttl
+
+    @staticmethod
+    def _live_data():
+        # Existing row's data in an UPDATE (or ON CONFLICT DO UPDATE), or {}
+        # once expired
+        return case(
+            (fsm_table.c.expires_at > func.now(), fsm_table.c.data),
+            else_=EMPTY_JSONB,
+        )
+
+    @staticmethod
+    def _live_state():
+        # Existing row's state when a data write extends it, or NULL once
+        # expired, so pushing expires_at forward can't revive a stale flow
+        return case(
+            (fsm_table.c.expires_at > func.now(), fsm_table.c.state),
+            else_=None,
+        )
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        storage_key = self.key_builder.build(key)
+
+        async with self.engine.begin() as conn:
+            if state is None:
+                await conn.execute(
+                    update(fsm_table)
+                    .where(fsm_table.c.key == storage_key)
+                    # An expired flow's data goes too, so the row can be dropped
+                    .values(
+                        state=None, data=self._live_data(), expires_at=self._expires_at()
+                    )
+                )
+                await self._delete_if_empty(conn, storage_key)
+                return
+
+            await conn.execute(
+                insert(fsm_table)
+                .values(key=storage_key, state=state, expires_at=self._expires_at())
+                .on_conflict_do_update(
+                    index_elements=[fsm_table.c.key],
+                    set_={
+                        "state": state,
+                        # data from an expired flow must not leak into a new one
+                        "data": self._live_data(),
+                        "expires_at": self._expires_at(),
+                    },
+                )
+            )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(fsm_table.c.state)
+                .where(fsm_table.c.key == self.key_builder.build(key))
+                .where(fsm_table.c.expires_at > func.now())
+            )
+            return result.scalar_one_or_none()
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+
+        async with self.engine.begin() as conn:
+            if not data:
+                await conn.execute(
+                    update(fsm_table)
+                    .where(fsm_table.c.key == storage_key)
+                    .values(
+                        data={}, state=self._live_state(), expires_at=self._expires_at()
+                    )
+                )
+                await self._delete_if_empty(conn, storage_key)
+                return
+
+            await conn.execute(
+                insert(fsm_table)
+                .values(key=storage_key, data=dict(data), expires_at=self._expires_at())
+                .on_conflict_do_update(
+                    index_elements=[fsm_table.c.key],
+                    set_={
+                        "data": insert(fsm_table).excluded.data,
+                        "state": self._live_state(),
+                        "expires_at": self._expires_at(),
+                    },
+                )
+            )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(fsm_table.c.data)
+                .where(fsm_table.c.key == self.key_builder.build(key))
+                .where(fsm_table.c.expires_at > func.now())
+            )
+            return dict(result.scalar_one_or_none() or {})
+
+    async def update_data(
+        self, key: StorageKey, data: Mapping[str, Any]
+    ) -> Dict[str, Any]:
+        # One upsert that merges server-side instead of get_data + set_data
+        stmt = insert(fsm_table).values(
+            key=self.key_builder.build(key),
+            data=dict(data),
+            expires_at=self._expires_at(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[fsm_table.c.key],
+            set_={
+                "data": self._live_data().op("||")(stmt.excluded.data),
+                "state": self._live_state(),
+                "expires_at": self._expires_at(),
+            },
+        ).returning(fsm_table.c.data)
+
+        async with self.engine.begin() as conn:
+            result = await conn.execute(stmt)
+            return dict(result.scalar_one())
+
+    async def _delete_if_empty(self, conn, storage_key: str) -> None:
+        await conn.execute(
+            delete(fsm_table)
+            .where(fsm_table.c.key == storage_key)
+            .where(fsm_table.c.state.is_(None))
+            .where(fsm_table.c.data == EMPTY_JSONB)
+        )
+
+    async def delete_expired(self) -> int:
+        """
+        Remove expired flows `cleanup_batch` rows at a time, each batch in its
+        own short transaction so cleanup never holds locks for long.
+        """
+        expired_keys = (
+            select(fsm_table.c.key)
+            .where(fsm_table.c.expires_at <= func.now())
+            .limit(self.cleanup_batch)
+            .with_for_update(skip_locked=True)
+        )
+
+        total = 0
+        while True:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    delete(fsm_table).where(fsm_table.c.key.in_(expired_keys))
+                )
+            total += result.rowcount
+            if result.rowcount < self.cleanup_batch:
+                return total
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            try:
+                deleted = await self.delete_expired()
+                if deleted:
+                    print(f"FSM storage: removed {deleted} expired flows")
+            except Exception as e:
+                print(f"FSM storage cleanup failed: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def start_cleanup(self) -> None:
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def close(self) -> None:
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+
+
+def create_fsm_storage() -> BaseStorage:
+    if FSM_STORAGE == "postgres":
+        return PostgresStorage()
+    return MemoryStorage()
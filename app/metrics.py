@@ -0,0 +1,246 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Covers per-handler latency, DB query count/time per update (SQLAlchemy engine
+events), connection-pool checkout wait, outbound Bot API calls, the send queue and
+write-behind activity tracking.
+"""
+
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+load_dotenv()
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 disables the /metrics endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, *label_values: str, value: float) -> None:
+        self.values[label_values] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [bucket counts..., +Inf count, sum]
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def summary(self, *label_values: str) -> tuple[int, float]:
+        """(count, sum) for one label set."""
+        series = self.values.get(label_values)
+        if series is None:
+            return 0, 0.0
+        return int(sum(series[:-1])), series[-1]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+throttled_updates_total = Counter(
+    "bot_throttled_updates_total", "Updates dropped by per-user throttling", ("command_class",)
+)
+throttle_notices_total = Counter(
+    "bot_throttle_notices_total", "Slow-down notices sent to throttled users"
+)
+handler_latency = Histogram(
+    "bot_handler_latency_seconds", "Handler latency", ("router", "handler")
+)
+updates_total = Counter("bot_updates_total", "Processed updates")
+update_latency = Histogram("bot_update_latency_seconds", "End-to-end update latency")
+update_queue_depth = Gauge(
+    "bot_update_queue_depth", "Accepted updates waiting for a handler slot or their user's turn"
+)
+updates_in_flight = Gauge("bot_updates_in_flight", "Updates being handled")
+update_wait = Histogram(
+    "bot_update_wait_seconds", "Wait for a handler slot and the user's previous updates"
+)
+db_queries_per_update = Histogram(
+    "bot_db_queries_per_update", "DB queries issued per update", buckets=COUNT_BUCKETS
+)
+db_time_per_update = Histogram(
+    "bot_db_time_per_update_seconds", "Time spent in DB queries per update"
+)
+db_queries_total = Counter("bot_db_queries_total", "DB queries executed")
+db_query_latency = Histogram("bot_db_query_latency_seconds", "DB query latency")
+db_reads_total = Counter(
+    "bot_db_reads_total", "Read sessions by target (primary, replica, fallback)", ("target",)
+)
+pool_checkout_wait = Histogram(
+    "bot_db_pool_checkout_wait_seconds", "Wait for a pooled DB connection"
+)
+bot_api_latency = Histogram(
+    "bot_api_request_latency_seconds", "Bot API call latency", ("method",)
+)
+bot_api_errors = Counter("bot_api_errors_total", "Failed Bot API calls", ("method", "error"))
+send_queue_depth = Gauge(
+    "bot_send_queue_depth", "Bot API calls waiting for a send token", ("priority",)
+)
+send_wait = Histogram(
+    "bot_send_wait_seconds", "Wait for send tokens before a Bot API call", ("priority",)
+)
+send_retry_after = Counter("bot_send_retry_after_total", "RetryAfter responses from Telegram")
+activity_pending = Gauge("bot_activity_pending_users", "Users with unflushed activity")
+activity_flush_lag = Histogram(
+    "bot_activity_flush_lag_seconds",
+    "Age of the oldest activity record when flushed",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+activity_flush_latency = Histogram(
+    "bot_activity_flush_latency_seconds", "Time to write one activity batch"
+)
+activity_flushed_total = Counter("bot_activity_flushed_users_total", "Users flushed")
+activity_dropped_total = Counter(
+    "bot_activity_dropped_total", "Activity records dropped (buffer full or flush failed)"
+)
+
+REGISTRY: list[Counter | Histogram] = [
+    updates_total,
+    update_latency,
+    update_queue_depth,
+    updates_in_flight,
+    update_wait,
+    throttled_updates_total,
+    throttle_notices_total,
+    handler_latency,
+    db_queries_total,
+    db_query_latency,
+    db_queries_per_update,
+    db_time_per_update,
+    db_reads_total,
+    pool_checkout_wait,
+    bot_api_latency,
+    bot_api_errors,
+    send_queue_depth,
+    send_wait,
+    send_retry_after,
+    activity_pending,
+    activity_flush_lag,
+    activity_flush_latency,
+    activity_flushed_total,
+    activity_dropped_total,
+]
+
+# [query count, query time] for the update being processed
+update_db_stats: ContextVar[list[float] | None] = ContextVar("update_db_stats", default=None)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection."""
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started_at)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_started_at"].pop()
+        db_queries_total.inc()
+        db_query_latency.observe(duration)
+
+        stats = update_db_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += duration
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(port_offset: int = 0) -> web.AppRunner | None:
+    if not METRICS_PORT:
+        return None
+    port = METRICS_PORT + port_offset
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=METRICS_HOST, port=port).start()
+    print(f"Metrics available on http://{METRICS_HOST}:{port}/metrics")
+    return runner
@@ -0,0 +1,33 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User as TelegramUser
+
+from app.models import User
+from app.services.user.activity import activity_recorder
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Feeds the activity recorder from every update of a registered user. Runs
+    after AuthMiddleware, so recording costs no DB access here.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("user")
+        from_user: TelegramUser | None = data.get("event_from_user")
+
+        if user is not None and from_user is not None:
+            tg_username = from_user.username or ""
+            activity_recorder.record(
+                user.tg_user_id,
+                is_message=event.message is not None,
+                tg_username=tg_username if tg_username != user.tg_username else None,
+            )
+
+        return await handler(event, data)
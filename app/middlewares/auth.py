@@ -0,0 +1,31 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+
+from app.services.user.service import UserService
+
+
+class AuthMiddleware(BaseMiddleware):
+    """
+    Resolves the calling user's `User` row once per update and exposes it to
+    filters and handlers as the `user` keyword argument (None if the caller
+    hasn't registered yet).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user: TelegramUser | None = data.get("event_from_user")
+
+        if from_user:
+            data["user"] = await UserService.get_user_by_tg_user_id(
+                tg_user_id=str(from_user.id)
+            )
+        else:
+            data["user"] = None
+
+        return await handler(event, data)
@@ -0,0 +1,54 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.metrics import (
+    db_queries_per_update,
+    db_time_per_update,
+    update_db_stats,
+    update_latency,
+    updates_total,
+)
+
+logger = logging.getLogger(__name__)
+
+# Set by the webhook server when the HTTP request arrives; background handler
+# tasks inherit it, so latency covers queueing as well as processing.
+update_received_at: ContextVar[float | None] = ContextVar(
+    "update_received_at", default=None
+)
+
+
+class LatencyMiddleware(BaseMiddleware):
+    """Logs and records the end-to-end processing time and DB usage of every update."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started_at = update_received_at.get() or time.perf_counter()
+        db_stats = [0, 0.0]
+        update_db_stats.set(db_stats)
+        try:
+            return await handler(event, data)
+        finally:
+            duration = time.perf_counter() - started_at
+            updates_total.inc()
+            update_latency.observe(duration)
+            db_queries_per_update.observe(db_stats[0])
+            db_time_per_update.observe(db_stats[1])
+
+            update_id = event.update_id if isinstance(event, Update) else None
+            logger.info(
+                "Update id=%s handled in %.1f ms (%d DB queries, %.1f ms)",
+                update_id,
+                duration * 1000,
+                db_stats[0],
+                db_stats[1] * 1000,
+            )
@@ -0,0 +1,53 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+from app.metrics import bot_api_errors, bot_api_latency, handler_latency
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware recording latency per (router, handler)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started_at = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_latency.observe(
+                time.perf_counter() - started_at,
+                data["event_router"].name,
+                data["handler"].callback.__name__,
+            )
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware recording latency and errors of outbound Bot API calls."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        method_name = method.__api_method__
+        started_at = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            bot_api_errors.inc(method_name, type(e).__name__)
+            raise
+        finally:
+            bot_api_latency.observe(time.perf_counter() - started_at, method_name)
@@ -0,0 +1,24 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from app.filters.text_command import parse_text_command
+
+
+class TextCommandMiddleware(BaseMiddleware):
+    """
+    Parses the message text (or document caption) against the registered
+    text commands once, before routing, and exposes the result to `TextCommand`
+    filters and handlers as `text_command` (None for ordinary text).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Already parsed when ThrottlingMiddleware classified the update
+        parse_text_command(event, data)
+        return await handler(event, data)
@@ -0,0 +1,135 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+from dotenv import load_dotenv
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject, Update, User as TelegramUser
+
+from app.filters.text_command import parse_text_command
+from app.metrics import throttle_notices_total, throttled_updates_total
+from app.rate_limit import TokenBucket
+
+load_dotenv()
+# Per user and command class: sustained updates/sec and burst size
+THROTTLE_READ_RATE = float(os.getenv("THROTTLE_READ_RATE", "1"))
+THROTTLE_READ_BURST = float(os.getenv("THROTTLE_READ_BURST", "5"))
+THROTTLE_WRITE_RATE = float(os.getenv("THROTTLE_WRITE_RATE", "0.2"))
+THROTTLE_WRITE_BURST = float(os.getenv("THROTTLE_WRITE_BURST", "3"))
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))
+# At most one "slow down" reply per user in this many seconds
+THROTTLE_NOTICE_WINDOW = float(os.getenv("THROTTLE_NOTICE_WINDOW", "10"))
+
+READ = "read"
+WRITE = "write"
+
+# Text commands that change data; everything else counts as a read
+WRITE_COMMANDS = frozenset(
+    {
+        "update name",
+        "update email",
+        "update role",
+        "update roles",
+        "delete user",
+        "delete users",
+        "broadcast",
+        "import users",
+    }
+)
+
+SLOW_DOWN = "⏳ You're sending too fast, please wait a few seconds."
+
+
+def command_class(event: Update, data: Dict[str, Any]) -> str:
+    message = event.message
+    if message is None:
+        return READ
+    command = parse_text_command(message, data)
+    return WRITE if command is not None and command.name in WRITE_COMMANDS else READ
+
+
+class _UserThrottle:
+    __slots__ = ("buckets", "seen_at", "notice_until")
+
+    def __init__(self):
+        self.buckets: dict[str, TokenBucket] = {}
+        self.seen_at = 0.0
+        self.notice_until = 0.0
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Drops updates from users exceeding their token bucket for the update's
+    command class (stricter for writes), before they cost a handler slot or a
+    DB query. The sender gets one notice per THROTTLE_NOTICE_WINDOW.
+
+    Users are kept in an LRU of at most `max_users`. An idle user's buckets are
+    full again after `idle_after` seconds, so dropping them then loses nothing.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]] | None = None,
+        max_users: int = THROTTLE_MAX_USERS,
+        notice_window: float = THROTTLE_NOTICE_WINDOW,
+    ):
+        # Command class -> (rate, burst)
+        self.limits = limits or {
+            READ: (THROTTLE_READ_RATE, THROTTLE_READ_BURST),
+            WRITE: (THROTTLE_WRITE_RATE, THROTTLE_WRITE_BURST),
+        }
+        self.max_users = max_users
+        self.notice_window = notice_window
+        self.idle_after = max(burst / rate for rate, burst in self.limits.values())
+
+        self._users: OrderedDict[int, _UserThrottle] = OrderedDict()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user: TelegramUser | None = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+
+        cls = command_class(event, data)
+        throttle = self._user(from_user.id)
+        bucket = throttle.buckets.get(cls)
+        if bucket is None:
+            rate, burst = self.limits[cls]
+            bucket = throttle.buckets[cls] = TokenBucket(rate, burst)
+
+        if bucket.try_acquire():
+            return await handler(event, data)
+
+        throttled_updates_total.inc(cls)
+        if throttle.seen_at >= throttle.notice_until:
+            throttle.notice_until = throttle.seen_at + self.notice_window
+            await self._notify(data["bot"], event)
+        return None
+
+    def _user(self, tg_user_id: int) -> _UserThrottle:
+        now = time.monotonic()
+        throttle = self._users.pop(tg_user_id, None) or _UserThrottle()
+        throttle.seen_at = now
+        self._users[tg_user_id] = throttle
+
+        # Least recently seen first: stop at the first one still active
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        while True:
+            oldest = next(iter(self._users.values()))
+            if now - oldest.seen_at < self.idle_after:
+                break
+            self._users.popitem(last=False)
+        return throttle
+
+    async def _notify(self, bot: Bot, event: Update) -> None:
+        throttle_notices_total.inc()
+        if event.callback_query is not None:
+            await bot.answer_callback_query(event.callback_query.id, text=SLOW_DOWN)
+        elif event.message is not None:
+            await bot.send_message(event.message.chat.id, SLOW_DOWN)
@@ -0,0 +1,49 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+from app.database import current_unit_of_work, unit_of_work
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """
+    Wraps each update in a unit of work, so all of its queries (AuthMiddleware
+    lookup, filters, handler) share one pooled connection, checked out only if
+    the update touches the database at all and returned around Bot API calls
+    (see ReleaseConnectionMiddleware).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with unit_of_work():
+            return await handler(event, data)
+
+
+class ReleaseConnectionMiddleware(BaseRequestMiddleware):
+    """
+    Session middleware returning the current update's connection to the pool
+    before each Bot API call, which may wait on the send scheduler (or a
+    RetryAfter pause) for seconds.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        uow = current_unit_of_work.get()
+        if uow is not None:
+            await uow.release()
+        return await make_request(bot, method)
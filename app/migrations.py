@@ -0,0 +1,311 @@
+"""
+Versioned schema migrations.
+
+The applied version lives in `app_meta`, so a boot against an up-to-date
+database costs a single query instead of `create_all` reflecting every table.
+Pending migrations run in one transaction under an advisory lock, so several
+processes starting at once (rolling deploys, workers) apply them only once.
+
+To change the schema, append a migration to MIGRATIONS; never edit or reorder
+released ones, nor the SQL constants they run. Migrations run after the baseline, which already creates the
+tables from the current models, so write them idempotently
+(`ADD COLUMN IF NOT EXISTS`, `CREATE INDEX IF NOT EXISTS`, ...).
+"""
+
+from typing import Awaitable, Callable
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlmodel import SQLModel, select
+
+from app.database import async_engine
+from app.models import AppMeta, DailyRegistrations, User, UserCounter
+
+SCHEMA_VERSION_KEY = "schema_version"
+# Arbitrary constant identifying the migration lock
+MIGRATION_LOCK_ID = 0x7B07
+
+
+async def _baseline(conn: AsyncConnection) -> None:
+    await conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    await conn.run_sync(SQLModel.metadata.create_all)
+    # create_all skips indexes on tables that already exist
+    for index in User.__table__.indexes:
+        await conn.run_sync(index.create, checkfirst=True)
+
+
+async def _user_activity(conn: AsyncConnection) -> None:
+    await conn.exec_driver_sql(
+        "ALTER TABLE users"
+        " ADD COLUMN IF NOT EXISTS last_seen_at timestamptz,"
+        " ADD COLUMN IF NOT EXISTS message_count integer NOT NULL DEFAULT 0"
+    )
+
+
+# Released migrations run the SQL they shipped with, so it is spelled out per
+# migration rather than built from shared helpers: to change the counters, add
+# a migration with new constants (as "count active users only" does).
+
+# Statement-level, so a bulk import or an activity flush costs one counter
+# update per statement, and updates that change no counted column none at all.
+# Counts "total", "active" and "role:<role>" over every row.
+USER_COUNTERS_V3_FUNCTION = """
+CREATE OR REPLACE FUNCTION users_update_counters() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO user_counters (name, value)
+        SELECT counter.name, sum(changed.delta)
+        FROM (SELECT 1 AS delta, is_active, role FROM new_rows) AS changed,
+            LATERAL (VALUES
+                ('total'),
+                (CASE WHEN changed.is_active THEN 'active' END),
+                ('role:' || changed.role)
+            ) AS counter(name)
+        WHERE counter.name IS NOT NULL
+        GROUP BY counter.name
+        HAVING sum(changed.delta) <> 0
+        ON CONFLICT (name) DO UPDATE SET value = user_counters.value + excluded.value;
+
+        INSERT INTO user_registrations (day, registrations)
+        SELECT created_at::date, count(*) FROM new_rows GROUP BY 1
+        ON CONFLICT (day) DO UPDATE
+        SET registrations = user_registrations.registrations + excluded.registrations;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO user_counters (name, value)
+        SELECT counter.name, sum(changed.delta)
+        FROM (SELECT -1 AS delta, is_active, role FROM old_rows) AS changed,
+            LATERAL (VALUES
+                ('total'),
+                (CASE WHEN changed.is_active THEN 'active' END),
+                ('role:' || changed.role)
+            ) AS counter(name)
+        WHERE counter.name IS NOT NULL
+        GROUP BY counter.name
+        HAVING sum(changed.delta) <> 0
+        ON CONFLICT (name) DO UPDATE SET value = user_counters.value + excluded.value;
+    ELSE
+        INSERT INTO user_counters (name, value)
+        SELECT counter.name, sum(changed.delta)
+        FROM (
+            SELECT 1 AS delta, is_active, role FROM new_rows
+            UNION ALL SELECT -1, is_active, role FROM old_rows
+        ) AS changed,
+            LATERAL (VALUES
+                ('total'),
+                (CASE WHEN changed.is_active THEN 'active' END),
+                ('role:' || changed.role)
+            ) AS counter(name)
+        WHERE counter.name IS NOT NULL
+        GROUP BY counter.name
+        HAVING sum(changed.delta) <> 0
+        ON CONFLICT (name) DO UPDATE SET value = user_counters.value + excluded.value;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+USER_COUNTERS_V3_BACKFILL = """
+INSERT INTO user_counters (name, value)
+SELECT counter.name, sum(changed.delta)
+FROM (SELECT 1 AS delta, is_active, role FROM users) AS changed,
+    LATERAL (VALUES
+        ('total'),
+        (CASE WHEN changed.is_active THEN 'active' END),
+        ('role:' || changed.role)
+    ) AS counter(name)
+WHERE counter.name IS NOT NULL
+GROUP BY counter.name
+HAVING sum(changed.delta) <> 0
+ON CONFLICT (name) DO UPDATE SET value = user_counters.value + excluded.value;
+"""
+
+# Transition tables allow a single event per trigger
+USER_COUNTERS_TRIGGERS = {
+    "INSERT": "REFERENCING NEW TABLE AS new_rows",
+    "UPDATE": "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "REFERENCING OLD TABLE AS old_rows",
+}
+
+
+async def _user_counters(conn: AsyncConnection) -> None:
+    for table in (UserCounter.__table__, DailyRegistrations.__table__):
+        await conn.run_sync(table.create, checkfirst=True)
+    await conn.exec_driver_sql(USER_COUNTERS_V3_FUNCTION)
+
+    # Block writes to users while the counters are backfilled
+    await conn.exec_driver_sql("LOCK TABLE users IN SHARE ROW EXCLUSIVE MODE")
+    for event, transition_tables in USER_COUNTERS_TRIGGERS.items():
+        name = f"users_counters_{event.lower()}"
+        await conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name} ON users")
+        await conn.exec_driver_sql(
+            f"CREATE TRIGGER {name} AFTER {event} ON users {transition_tables}"
+            " FOR EACH STATEMENT EXECUTE FUNCTION users_update_counters()"
+        )
+
+    await conn.exec_driver_sql("DELETE FROM user_counters")
+    await conn.exec_driver_sql("DELETE FROM user_registrations")
+    await conn.exec_driver_sql(USER_COUNTERS_V3_BACKFILL)
+    await conn.exec_driver_sql(
+        "INSERT INTO user_registrations (day, registrations)"
+        " SELECT created_at::date, count(*) FROM users GROUP BY 1"
+    )
+
+
+async def _create_users_index(conn: AsyncConnection, name: str) -> None:
+    index = next(i for i in User.__table__.indexes if i.name == name)
+    await conn.run_sync(index.create, checkfirst=True)
+
+
+async def _soft_delete(conn: AsyncConnection) -> None:
+    await _create_users_index(conn, "ix_users_inactive_updated_at")
+
+
+async def _release_deleted_emails(conn: AsyncConnection) -> None:
+    # Emails only have to be unique among active users
+    await _create_users_index(conn, "ix_users_email_active")
+    await conn.exec_driver_sql("DROP INDEX IF EXISTS ix_users_email")
+
+
+# Soft-deleted (inactive) rows only count as "deleted" until purged: "total"
+# and "role:<role>" cover active users, see UserCounter
+USER_COUNTERS_V6_FUNCTION = """
+CREATE OR REPLACE FUNCTION users_update_counters() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO user_counters (name, value)
+        SELECT counter.name, sum(changed.delta)
+        FROM (SELECT 1 AS delta, is_active, role FROM new_rows) AS changed,
+            LATERAL (VALUES
+                (CASE WHEN changed.is_active THEN 'total' ELSE 'deleted' END),
+                (CASE WHEN changed.is_active THEN 'role:' || changed.role END)
+            ) AS counter(name)
+        WHERE counter.name IS NOT NULL
+        GROUP BY counter.name
+        HAVING sum(changed.delta) <> 0
+        ON CONFLICT (name) DO UPDATE SET value = user_counters.value + excluded.value;
+
+        INSERT INTO user_registrations (day, registrations)
+        SELECT created_at::date, count(*) FROM new_rows GROUP BY 1
+        ON CONFLICT (day) DO UPDATE
+        SET registrations = user_registrations.registrations + excluded.registrations;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO user_counters (name, value)
+        SELECT counter.name, sum(changed.delta)
+        FROM (SELECT -1 AS delta, is_active, role FROM old_rows) AS changed,
+            LATERAL (VALUES
+                (CASE WHEN changed.is_active THEN 'total' ELSE 'deleted' END),
+                (CASE WHEN changed.is_active THEN 'role:' || changed.role END)
+            ) AS counter(name)
+        WHERE counter.name IS NOT NULL
+        GROUP BY counter.name
+        HAVING sum(changed.delta) <> 0
+        ON CONFLICT (name) DO UPDATE SET value = user_counters.value + excluded.value;
+    ELSE
+        INSERT INTO user_counters (name, value)
+        SELECT counter.name, sum(changed.delta)
+        FROM (
+            SELECT 1 AS delta, is_active, role FROM new_rows
+            UNION ALL SELECT -1, is_active, role FROM old_rows
+        ) AS changed,
+            LATERAL (VALUES
+                (CASE WHEN changed.is_active THEN 'total' ELSE 'deleted' END),
+                (CASE WHEN changed.is_active THEN 'role:' || changed.role END)
+            ) AS counter(name)
+        WHERE counter.name IS NOT NULL
+        GROUP BY counter.name
+        HAVING sum(changed.delta) <> 0
+        ON CONFLICT (name) DO UPDATE SET value = user_counters.value + excluded.value;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+USER_COUNTERS_V6_BACKFILL = """
+INSERT INTO user_counters (name, value)
+SELECT counter.name, sum(changed.delta)
+FROM (SELECT 1 AS delta, is_active, role FROM users) AS changed,
+    LATERAL (VALUES
+        (CASE WHEN changed.is_active THEN 'total' ELSE 'deleted' END),
+        (CASE WHEN changed.is_active THEN 'role:' || changed.role END)
+    ) AS counter(name)
+WHERE counter.name IS NOT NULL
+GROUP BY counter.name
+HAVING sum(changed.delta) <> 0
+ON CONFLICT (name) DO UPDATE SET value = user_counters.value + excluded.value;
+"""
+
+
+async def _count_active_users(conn: AsyncConnection) -> None:
+    await conn.exec_driver_sql(USER_COUNTERS_V6_FUNCTION)
+    # Block writes to users while the counters are rebuilt
+    await conn.exec_driver_sql("LOCK TABLE users IN SHARE ROW EXCLUSIVE MODE")
+    await conn.exec_driver_sql("DELETE FROM user_counters")
+    await conn.exec_driver_sql(USER_COUNTERS_V6_BACKFILL)
+
+
+# Version N is reached by applying MIGRATIONS[N - 1]
+MIGRATIONS: list[tuple[str, Callable[[AsyncConnection], Awaitable[None]]]] = [
+    ("baseline", _baseline),
+    ("user activity", _user_activity),
+    ("user counters", _user_counters),
+    ("soft delete", _soft_delete),
+    ("release deleted emails", _release_deleted_emails),
+    ("count active users only", _count_active_users),
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+async def read_meta() -> dict[str, str]:
+    """All of `app_meta` in one round trip; empty before the first migration."""
+    async with async_engine.connect() as conn:
+        try:
+            result = await conn.execute(select(AppMeta.key, AppMeta.value))
+        except ProgrammingError:
+            return {}
+        return dict(result.all())
+
+
+async def write_meta(key: str, value: str, conn: AsyncConnection | None = None) -> None:
+    statement = insert(AppMeta).values(key=key, value=value)
+    statement = statement.on_conflict_do_update(
+        index_elements=[AppMeta.key], set_={"value": statement.excluded.value}
+    )
+    if conn is not None:
+        await conn.execute(statement)
+        return
+    async with async_engine.begin() as conn:
+        await conn.execute(statement)
+
+
+async def migrate(meta: dict[str, str] | None = None) -> int:
+    """
+    Bring the schema to LATEST_VERSION. `meta` (from `read_meta`) skips the
+    version lookup on the fast path. Returns the number of migrations applied.
+    """
+    if meta is None:
+        meta = await read_meta()
+    if int(meta.get(SCHEMA_VERSION_KEY, 0)) >= LATEST_VERSION:
+        return 0
+
+    async with async_engine.begin() as conn:
+        await conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_ID})")
+        # Re-read under the lock: another process may have migrated meanwhile
+        try:
+            async with conn.begin_nested():
+                version = await conn.scalar(
+                    select(AppMeta.value).where(AppMeta.key == SCHEMA_VERSION_KEY)
+                )
+        except ProgrammingError:
+            version = None
+        current = int(version or 0)
+
+        for version, (name, migration) in enumerate(MIGRATIONS[current:], current + 1):
+            print(f"Applying migration {version} ({name})...")
+            await migration(conn)
+        if current < LATEST_VERSION:
+            await write_meta(SCHEMA_VERSION_KEY, str(LATEST_VERSION), conn=conn)
+
+    return max(LATEST_VERSION - current, 0)
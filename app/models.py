@@ -1,8 +1,11 @@
 from uuid import UUID, uuid4
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from enum import Enum
 
-from sqlalchemy import text, UniqueConstraint, Column, DateTime
+from typing import Any
+
+from sqlalchemy import text, UniqueConstraint, BigInteger, Column, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import Field, SQLModel
 
 
@@ -35,10 +38,118 @@ class TimestampModel(SQLModel):
 
 class User(UUIDModel, TimestampModel, table=True):
     __tablename__ = "users"
+    __table_args__ = (
+        # Backs keyset pagination of the admin user list (newest first)
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Deleted (inactive) users don't keep their email taken until purged
+        Index(
+            "ix_users_email_active",
+            "email",
+            unique=True,
+            postgresql_where=text("is_active"),
+        ),
+        # Lets the purge job find soft-deleted users without scanning active ones
+        Index(
+            "ix_users_inactive_updated_at",
+            "updated_at",
+            postgresql_where=text("NOT is_active"),
+        ),
+        # Trigram indexes for fuzzy `find user` search (needs pg_trgm)
+        *(
+            Index(
+                f"ix_users_{column}_trgm",
+                column,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+            for column in ("name", "email", "tg_username")
+        ),
+    )
 
     tg_user_id: str = Field(nullable=False, unique=True, index=True)
     tg_username: str = Field(nullable=False)
     name: str = Field(nullable=False)
-    email: str = Field(nullable=False, unique=True, index=True)
+    # Unique among active users only, see ix_users_email_active
+    email: str = Field(nullable=False)
     role: str = Field(default="user", nullable=False)
+    # False once deleted; the row is purged later, see app/services/user/purge.py
     is_active: bool = Field(default=True, nullable=False)
+    # Written in batches by the activity recorder, see app/services/user/activity.py
+    last_seen_at: datetime | None = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
+    message_count: int = Field(
+        default=0, sa_column_kwargs={"server_default": text("0")}, nullable=False
+    )
+
+
+class FSMRecord(SQLModel, table=True):
+    """FSM state + data for one storage key, see app/fsm_storage.py."""
+
+    __tablename__ = "fsm_states"
+
+    key: str = Field(primary_key=True)
+    state: str | None = Field(default=None, nullable=True)
+    data: dict[str, Any] = Field(
+        default_factory=dict,
+        sa_column=Column(JSONB, nullable=False, server_default=text("'{}'::jsonb")),
+    )
+    expires_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True),
+    )
+
+
+class BroadcastJob(UUIDModel, TimestampModel, table=True):
+    __tablename__ = "broadcast_jobs"
+
+    created_by: str = Field(nullable=False)
+    text: str = Field(nullable=False)
+    status: str = Field(default="running", nullable=False, index=True)
+    # Last tg_user_id processed; users are walked in tg_user_id order
+    last_tg_user_id: str | None = Field(default=None, nullable=True)
+    delivered: int = Field(default=0, nullable=False)
+    failed: int = Field(default=0, nullable=False)
+    blocked: int = Field(default=0, nullable=False)
+    # Held by the process running the job, so only one process resumes it
+    lease_expires_at: datetime | None = Field(
+        default=None,
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+    )
+
+
+class AppMeta(SQLModel, table=True):
+    """Key/value state of the deployment (schema version, command hashes, ...)."""
+
+    __tablename__ = "app_meta"
+
+    key: str = Field(primary_key=True)
+    value: str = Field(nullable=False)
+
+
+class UserCounter(SQLModel, table=True):
+    """
+    Running user counts kept up to date by triggers on users (see
+    app/migrations.py) so stats never scan the table: "total" and "role:<role>"
+    count active users, "deleted" the soft-deleted rows awaiting the purge.
+    """
+
+    __tablename__ = "user_counters"
+
+    name: str = Field(primary_key=True)
+    value: int = Field(
+        default=0,
+        sa_column=Column(BigInteger, nullable=False, server_default=text("0")),
+    )
+
+
+class DailyRegistrations(SQLModel, table=True):
+    """Users registered per day, kept up to date by the same triggers."""
+
+    __tablename__ = "user_registrations"
+
+    day: date = Field(primary_key=True)
+    registrations: int = Field(
+        default=0,
+        sa_column=Column(BigInteger, nullable=False, server_default=text("0")),
+    )
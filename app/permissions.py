@@ -0,0 +1,41 @@
+"""
+Role -> permission model. Each role maps to a bitmask computed once at import,
+so a permission check is a dict lookup and a bitwise AND on the cached User.
+"""
+
+from enum import IntFlag, auto
+from functools import reduce
+from operator import or_
+
+from app.models import User
+
+
+class Permission(IntFlag):
+    NONE = 0
+    VIEW_USERS = auto()
+    MANAGE_ROLES = auto()
+    DELETE_USERS = auto()
+    BROADCAST = auto()
+    EXPORT_USERS = auto()
+    IMPORT_USERS = auto()
+    VIEW_STATS = auto()
+
+
+ALL_PERMISSIONS = reduce(or_, Permission, Permission.NONE)
+
+ROLE_PERMISSIONS: dict[str, Permission] = {
+    "user": Permission.NONE,
+    "moderator": Permission.VIEW_USERS | Permission.VIEW_STATS,
+    "admin": ALL_PERMISSIONS,
+}
+ROLES = tuple(ROLE_PERMISSIONS)
+DEFAULT_ROLE = "user"
+
+
+def permissions_of(role: str) -> Permission:
+    # Unknown roles (e.g. set directly in the DB) get no permissions
+    return ROLE_PERMISSIONS.get(role, Permission.NONE)
+
+
+def has_permission(user: User | None, permission: Permission) -> bool:
+    return user is not None and permission in permissions_of(user.role)
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens, refilled at `rate`
+    tokens per second. `acquire` waits until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` would be available."""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1) -> None:
+        # The lock keeps waiters FIFO instead of all waking up at once
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep(self.delay(tokens))
+
+    def release(self, tokens: float = 1) -> None:
+        """Give back tokens taken for work that was abandoned."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket so nothing is sent for `seconds` (e.g. on RetryAfter)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
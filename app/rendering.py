@@ -0,0 +1,63 @@
+import html
+import re
+from string import Formatter
+
+# Telegram's limit for a single text message, in UTF-16 code units of the
+# text left after entity parsing
+MESSAGE_LIMIT = 4096
+
+_HTML_TAG = re.compile(r"<[^>]*>")
+
+
+class Template:
+    """
+    Message template compiled once at import time.
+
+    The `str.format`-style source is split into its static chunks and field
+    names up front, so rendering only fills in the dynamic values and joins.
+    Values are inserted as-is: escape user input with `aiogram.html` helpers.
+    """
+
+    __slots__ = ("source", "_parts")
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: list[tuple[str, str | None, str]] = [
+            (literal, field, spec or "")
+            for literal, field, spec, _ in Formatter().parse(source)
+        ]
+
+    def render(self, **fields) -> str:
+        chunks = []
+        for literal, field, spec in self._parts:
+            chunks.append(literal)
+            if field is not None:
+                value = fields[field]
+                chunks.append(format(value, spec) if spec else str(value))
+        return "".join(chunks)
+
+
+def message_length(text: str) -> int:
+    """
+    Length of an HTML-formatted message as Telegram counts it: tags removed,
+    entities unescaped, in UTF-16 code units (emoji outside the BMP count 2).
+    """
+    return len(html.unescape(_HTML_TAG.sub("", text)).encode("utf-16-le")) // 2
+
+
+def join_messages(*parts: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Merge HTML reply parts into as few messages as fit Telegram's length
+    limit, so a multi-part reply costs one Bot API call instead of one per part.
+    """
+    messages: list[str] = []
+    length = 0
+    for part in filter(None, (part.strip("\n") for part in parts)):
+        part_length = message_length(part)
+        if messages and length + 2 + part_length <= limit:
+            messages[-1] = f"{messages[-1]}\n\n{part}"
+            length += 2 + part_length
+        else:
+            messages.append(part)
+            length = part_length
+    return messages
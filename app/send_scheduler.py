@@ -0,0 +1,159 @@
+"""
+Outbound Bot API send scheduler.
+
+Installed as a session middleware on the Bot, so every call that targets a chat
+(send*/edit*/...) first takes a token from that chat's bucket and then from a
+global bucket. Waiters for the global bucket are served by priority, so
+interactive replies overtake bulk traffic such as broadcasts. TelegramRetryAfter
+pauses the affected chat, or every chat when it hit the bot-wide limit, and the
+call is retried transparently.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from enum import IntEnum
+from dotenv import load_dotenv
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from app.metrics import send_queue_depth, send_retry_after, send_wait
+from app.rate_limit import TokenBucket
+
+load_dotenv()
+# Per bot token, so divide by BOT_WORKERS in multi-process mode
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_MAX_CHATS = int(os.getenv("SEND_MAX_CHATS", "10000"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+# Priority of Bot API calls made from the current task; bulk jobs set BULK
+send_priority: ContextVar[Priority] = ContextVar(
+    "send_priority", default=Priority.INTERACTIVE
+)
+
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(
+        self,
+        global_rate: float = SEND_GLOBAL_RATE,
+        chat_rate: float = SEND_CHAT_RATE,
+        chat_burst: float = SEND_CHAT_BURST,
+        max_chats: int = SEND_MAX_CHATS,
+        max_retries: int = SEND_MAX_RETRIES,
+    ):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self.max_retries = max_retries
+
+        # LRU of per-chat buckets; idle chats fall off the end
+        self._chat_buckets: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._waiters: list[tuple[Priority, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._pump: asyncio.Task | None = None
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getUpdates, setWebhook, answerCallbackQuery, ... aren't rate limited
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        for attempt in range(self.max_retries + 1):
+            started_at = time.perf_counter()
+            chat_bucket = self._chat_bucket(chat_id)
+            await chat_bucket.acquire()
+            # Telegram doesn't say which limit a RetryAfter is for; one for a
+            # chat we had barely sent to can't be that chat's own limit
+            chat_was_idle = chat_bucket.tokens >= chat_bucket.capacity - 1
+            await self._acquire_global(priority)
+            send_wait.observe(time.perf_counter() - started_at, priority.name)
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                send_retry_after.inc()
+                chat_bucket.pause(e.retry_after)
+                if chat_was_idle:
+                    self.global_bucket.pause(e.retry_after)
+                if attempt == self.max_retries:
+                    raise
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst
+            )
+            if len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire_global(self, priority: Priority) -> None:
+        if not self._waiters and self.global_bucket.try_acquire():
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self._update_depth()
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Handed a token just before the cancellation: give it back
+            if not waiter.cancelled():
+                self.global_bucket.release()
+            raise
+
+    async def _run_pump(self) -> None:
+        # Hands out global tokens to waiters, highest priority (then FIFO) first
+        while self._waiters:
+            await asyncio.sleep(self.global_bucket.delay())
+            if not self.global_bucket.try_acquire():
+                continue
+
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+            else:
+                # Every remaining waiter was cancelled
+                self.global_bucket.release()
+            self._update_depth()
+
+    def _update_depth(self) -> None:
+        depth = {priority: 0 for priority in Priority}
+        for priority, _, waiter in self._waiters:
+            if not waiter.done():
+                depth[priority] += 1
+        for priority, count in depth.items():
+            send_queue_depth.set(priority.name, value=count)
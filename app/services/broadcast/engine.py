@@ -0,0 +1,146 @@
+import asyncio
+import os
+from datetime import timedelta
+from uuid import UUID
+from dotenv import load_dotenv
+
+from aiogram import Bot, html
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+
+from app.database import detach_unit_of_work
+from app.models import BroadcastJob
+from app.rate_limit import TokenBucket
+from app.send_scheduler import Priority, send_priority
+from app.services.broadcast.service import BroadcastService
+from app.services.user.service import UserService
+
+load_dotenv()
+# Telegram allows ~30 messages/s per bot; stay below to leave room for replies
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "1000"))
+# Progress is persisted (and the lease renewed) every N recipients
+BROADCAST_SAVE_EVERY = int(os.getenv("BROADCAST_SAVE_EVERY", "100"))
+BROADCAST_LEASE = timedelta(seconds=int(os.getenv("BROADCAST_LEASE", "120")))
+
+
+class Broadcaster:
+    """
+    Runs broadcast jobs in background tasks. Recipients are walked in
+    tg_user_id order and the cursor is persisted regularly, so a job picks up
+    where it left off after a restart (see `resume`).
+    """
+
+    def __init__(self, rate: float = BROADCAST_RATE):
+        self.bucket = TokenBucket(rate)
+        self._tasks: dict[UUID, asyncio.Task] = {}
+
+    async def start(self, bot: Bot, created_by: str, text: str) -> BroadcastJob:
+        job = await BroadcastService.create_job(
+            created_by=created_by, text=text, lease=BROADCAST_LEASE
+        )
+        self._spawn(bot, job)
+        return job
+
+    async def resume(self, bot: Bot) -> None:
+        """Pick up running jobs whose previous owner went away."""
+        for job_id in await BroadcastService.get_resumable_job_ids():
+            job = await BroadcastService.claim_job(job_id, lease=BROADCAST_LEASE)
+            if job:
+                print(f"Resuming broadcast {job.id} after {job.last_tg_user_id}")
+                self._spawn(bot, job)
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, bot: Bot, job: BroadcastJob) -> None:
+        task = asyncio.create_task(self._run(bot, job))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def _run(self, bot: Bot, job: BroadcastJob) -> None:
+        # Spawned from a handler: use sessions of our own, not the update's
+        detach_unit_of_work()
+        # Queue behind interactive replies in the send scheduler
+        priority_token = send_priority.set(Priority.BULK)
+        unsaved = 0
+        error = None
+        try:
+            async for batch in UserService.iter_active_user_ids(
+                after=job.last_tg_user_id, batch_size=BROADCAST_BATCH_SIZE
+            ):
+                for tg_user_id in batch:
+                    await self._send(bot, job, tg_user_id)
+                    job.last_tg_user_id = tg_user_id
+
+                    unsaved += 1
+                    if unsaved >= BROADCAST_SAVE_EVERY:
+                        await BroadcastService.save_progress(job, lease=BROADCAST_LEASE)
+                        unsaved = 0
+
+            job.status = "done"
+        except Exception as e:
+            # e.g. the database went away: the job stays "running" and resumes
+            # from its last saved cursor on the next start
+            error = e
+            print(f"Broadcast {job.id} stopped after {job.last_tg_user_id}: {e!r}")
+        finally:
+            # On shutdown the lease is released so the next start resumes at once
+            try:
+                await BroadcastService.save_progress(job, lease=None)
+            except Exception as e:
+                # The lease expires by itself, resuming from the last saved cursor
+                print(f"Failed to save broadcast {job.id} progress: {e!r}")
+            send_priority.reset(priority_token)
+
+        await self._report(bot, job, error)
+
+    async def _send(self, bot: Bot, job: BroadcastJob, tg_user_id: str) -> None:
+        while True:
+            await self.bucket.acquire()
+            try:
+                await bot.send_message(chat_id=int(tg_user_id), text=job.text, parse_mode=None)
+                job.delivered += 1
+                return
+            except TelegramRetryAfter as e:
+                # The send scheduler gave up retrying: pause the whole job
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                job.blocked += 1
+                return
+            except TelegramAPIError:
+                job.failed += 1
+                return
+
+    async def _report(
+        self, bot: Bot, job: BroadcastJob, error: Exception | None = None
+    ) -> None:
+        text = render_job_status(job)
+        if error is not None:
+            text += (
+                f"\n⚠️ Stopped by {html.quote(type(error).__name__)}, "
+                "it resumes where it left off after a restart."
+            )
+        try:
+            await bot.send_message(chat_id=int(job.created_by), text=text)
+        except TelegramAPIError as e:
+            print(f"Failed to report broadcast {job.id}: {e}")
+
+
+def render_job_status(job: BroadcastJob) -> str:
+    return f"""
+📣 <b>Broadcast {html.code(str(job.id)[:8])}</b> – {job.status}
+
+Delivered: <code>{job.delivered}</code>
+Failed: <code>{job.failed}</code>
+Blocked: <code>{job.blocked}</code>
+"""
+
+
+broadcaster = Broadcaster()
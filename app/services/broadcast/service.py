@@ -0,0 +1,90 @@
+from datetime import timedelta
+from uuid import UUID
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import db_session
+from app.models import BroadcastJob
+
+
+class BroadcastService:
+
+    @staticmethod
+    async def create_job(created_by: str, text: str, lease: timedelta) -> BroadcastJob:
+        async for db in db_session():
+            job_record = await db.execute(
+                insert(BroadcastJob)
+                .values(
+                    created_by=created_by,
+                    text=text,
+                    lease_expires_at=func.now() + lease,
+                )
+                .returning(BroadcastJob)
+            )
+            job = job_record.scalar_one()
+            await db.commit()
+            return job
+
+    @staticmethod
+    async def get_latest_job() -> BroadcastJob | None:
+        async for db in db_session():
+            job_record = await db.execute(
+                select(BroadcastJob).order_by(BroadcastJob.created_at.desc()).limit(1)
+            )
+            return job_record.scalar_one_or_none()
+
+    @staticmethod
+    async def get_resumable_job_ids() -> list[UUID]:
+        """Running jobs whose lease has expired (their process stopped)."""
+        async for db in db_session():
+            job_ids = await db.execute(
+                select(BroadcastJob.id)
+                .where(BroadcastJob.status == "running")
+                .where(
+                    or_(
+                        BroadcastJob.lease_expires_at.is_(None),
+                        BroadcastJob.lease_expires_at < func.now(),
+                    )
+                )
+            )
+            return list(job_ids.scalars().all())
+
+    @staticmethod
+    async def claim_job(job_id: UUID, lease: timedelta) -> BroadcastJob | None:
+        """Take the job's lease; None if another process holds it or it's done."""
+        async for db in db_session():
+            job_record = await db.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id)
+                .where(BroadcastJob.status == "running")
+                .where(
+                    or_(
+                        BroadcastJob.lease_expires_at.is_(None),
+                        BroadcastJob.lease_expires_at < func.now(),
+                    )
+                )
+                .values(lease_expires_at=func.now() + lease)
+                .returning(BroadcastJob)
+            )
+            job = job_record.scalar_one_or_none()
+            await db.commit()
+            return job
+
+    @staticmethod
+    async def save_progress(job: BroadcastJob, lease: timedelta | None) -> None:
+        """Persist the cursor and counters, renewing (or releasing) the lease."""
+        async for db in db_session():
+            await db.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job.id)
+                .values(
+                    last_tg_user_id=job.last_tg_user_id,
+                    delivered=job.delivered,
+                    failed=job.failed,
+                    blocked=job.blocked,
+                    status=job.status,
+                    lease_expires_at=func.now() + lease if lease else None,
+                )
+            )
+            await db.commit()
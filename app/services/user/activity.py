@@ -0,0 +1,174 @@
+"""
+Write-behind tracking of user activity (last seen, message count, username).
+
+Updates only touch an in-memory dict; a background task merges it into
+`users` with one UPDATE ... FROM unnest(...) per batch, every
+ACTIVITY_FLUSH_INTERVAL seconds or as soon as ACTIVITY_FLUSH_SIZE users are
+pending. Memory is bounded by ACTIVITY_MAX_PENDING users, and whatever is
+pending is flushed on shutdown.
+"""
+
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+from sqlalchemy import ARRAY, Float, Integer, String, bindparam, text
+from sqlalchemy.exc import DBAPIError
+
+from app.database import async_engine
+from app.metrics import (
+    activity_dropped_total,
+    activity_flush_lag,
+    activity_flush_latency,
+    activity_flushed_total,
+    activity_pending,
+)
+from app.services.user.cache import user_cache
+from app.services.user.invalidation import notify_user_changed
+
+load_dotenv()
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5"))
+ACTIVITY_FLUSH_SIZE = int(os.getenv("ACTIVITY_FLUSH_SIZE", "5000"))
+ACTIVITY_MAX_PENDING = int(os.getenv("ACTIVITY_MAX_PENDING", "50000"))
+
+# Counters are added (several processes may flush the same user), last seen
+# only moves forward. Rows are locked in tg_user_id order to avoid deadlocks.
+FLUSH_QUERY = text(
+    """
+UPDATE users AS u SET
+    last_seen_at = greatest(u.last_seen_at, to_timestamp(v.seen_at)),
+    message_count = u.message_count + v.messages,
+    tg_username = coalesce(v.tg_username, u.tg_username)
+FROM unnest(:tg_user_ids, :seen_at, :messages, :tg_usernames)
+    AS v(tg_user_id, seen_at, messages, tg_username)
+WHERE u.tg_user_id = v.tg_user_id
+"""
+).bindparams(
+    bindparam("tg_user_ids", type_=ARRAY(String)),
+    bindparam("seen_at", type_=ARRAY(Float)),
+    bindparam("messages", type_=ARRAY(Integer)),
+    bindparam("tg_usernames", type_=ARRAY(String)),
+)
+
+
+class Activity:
+    __slots__ = ("first_seen_at", "seen_at", "messages", "tg_username")
+
+    def __init__(self, seen_at: float):
+        self.first_seen_at = seen_at
+        self.seen_at = seen_at
+        self.messages = 0
+        # Only set when the username differs from the stored one
+        self.tg_username: str | None = None
+
+
+class ActivityRecorder:
+    def __init__(
+        self,
+        flush_interval: float = ACTIVITY_FLUSH_INTERVAL,
+        flush_size: int = ACTIVITY_FLUSH_SIZE,
+        max_pending: int = ACTIVITY_MAX_PENDING,
+    ):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+
+        self._pending: dict[str, Activity] = {}
+        self._flush_now = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def record(
+        self, tg_user_id: str, is_message: bool, tg_username: str | None = None
+    ) -> None:
+        """Note activity of a registered user; `tg_username` only if it changed."""
+        now = time.time()
+        activity = self._pending.get(tg_user_id)
+        if activity is None:
+            if len(self._pending) >= self.max_pending:
+                activity_dropped_total.inc()
+                return
+            activity = self._pending[tg_user_id] = Activity(now)
+            activity_pending.set(value=len(self._pending))
+            if len(self._pending) >= self.flush_size:
+                self._flush_now.set()
+
+        activity.seen_at = now
+        if is_message:
+            activity.messages += 1
+        if tg_username is not None:
+            activity.tg_username = tg_username
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        batch, self._pending = self._pending, {}
+        activity_pending.set(value=0)
+        if not batch:
+            return
+
+        tg_user_ids = sorted(batch)
+        renamed = [tg_user_id for tg_user_id in tg_user_ids if batch[tg_user_id].tg_username]
+        started_at = time.perf_counter()
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(
+                    FLUSH_QUERY,
+                    {
+                        "tg_user_ids": tg_user_ids,
+                        "seen_at": [batch[i].seen_at for i in tg_user_ids],
+                        "messages": [batch[i].messages for i in tg_user_ids],
+                        "tg_usernames": [batch[i].tg_username for i in tg_user_ids],
+                    },
+                )
+                for tg_user_id in renamed:
+                    await notify_user_changed(conn, tg_user_id)
+        except asyncio.CancelledError:
+            # Interrupted by stop(), which flushes again right after
+            self._requeue(batch)
+            raise
+        except (OSError, DBAPIError) as e:
+            # Keep what fits so a short DB outage loses as little as possible
+            print(f"Failed to flush activity of {len(batch)} users: {e}")
+            self._requeue(batch)
+            return
+
+        activity_flush_latency.observe(time.perf_counter() - started_at)
+        activity_flush_lag.observe(time.time() - min(a.first_seen_at for a in batch.values()))
+        activity_flushed_total.inc(amount=len(batch))
+        for tg_user_id in renamed:
+            user_cache.invalidate(tg_user_id)
+
+    def _requeue(self, batch: dict[str, Activity]) -> None:
+        for tg_user_id, old in batch.items():
+            activity = self._pending.get(tg_user_id)
+            if activity is None:
+                if len(self._pending) >= self.max_pending:
+                    activity_dropped_total.inc()
+                    continue
+                self._pending[tg_user_id] = old
+                continue
+            activity.first_seen_at = old.first_seen_at
+            activity.messages += old.messages
+            activity.tg_username = activity.tg_username or old.tg_username
+        activity_pending.set(value=len(self._pending))
+
+
+activity_recorder = ActivityRecorder()
@@ -0,0 +1,117 @@
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from app.models import User
+
+load_dotenv()
+
+# Returned by lookups that have no (fresh) entry, so a cached "no such user"
+# (None) can be told apart from a cache miss.
+MISS = object()
+
+
+class UserCache:
+    """
+    In-process read-through cache for User rows keyed by tg_user_id, with a
+    secondary email -> tg_user_id index. Entries expire after `ttl` seconds and
+    the least recently used entry is evicted once `max_size` is reached.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, User | None]] = OrderedDict()
+        self._email_index: dict[str, str] = {}
+        # Bumped by every write so a read that raced a write doesn't put a
+        # stale row back into the cache.
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, tg_user_id: str):
+        entry = self._entries.get(tg_user_id)
+        if entry is None:
+            self.misses += 1
+            return MISS
+
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self._drop(tg_user_id)
+            self.misses += 1
+            return MISS
+
+        self._entries.move_to_end(tg_user_id)
+        self.hits += 1
+        return user
+
+    def get_by_email(self, email: str):
+        tg_user_id = self._email_index.get(email)
+        if tg_user_id is None:
+            self.misses += 1
+            return MISS
+        return self.get(tg_user_id)
+
+    def fill(self, tg_user_id: str, user: User | None, generation: int) -> None:
+        """Store a row read from the database, unless a write happened meanwhile."""
+        if generation != self._generation or self.max_size <= 0:
+            return
+        self._store(tg_user_id, user)
+
+    def set(self, user: User) -> None:
+        """Store a freshly written row."""
+        self._generation += 1
+        self._drop(user.tg_user_id)
+        if self.max_size > 0:
+            self._store(user.tg_user_id, user)
+
+    def invalidate(self, tg_user_id: str) -> None:
+        self._generation += 1
+        self._drop(tg_user_id)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self._email_index.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _store(self, tg_user_id: str, user: User | None) -> None:
+        self._drop(tg_user_id)
+        self._entries[tg_user_id] = (time.monotonic() + self.ttl, user)
+        if user is not None and user.email:
+            self._email_index[user.email] = tg_user_id
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, tg_user_id: str) -> None:
+        entry = self._entries.pop(tg_user_id, None)
+        if entry is None:
+            return
+        user = entry[1]
+        if user is not None and self._email_index.get(user.email) == tg_user_id:
+            del self._email_index[user.email]
+
+
+user_cache = UserCache(
+    max_size=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+)
@@ -0,0 +1,137 @@
+"""
+Bulk CSV export/import of users through Postgres COPY (asyncpg), so rows are
+streamed between the database and a file without being held in memory.
+"""
+
+import csv
+import time
+
+from app.database import async_engine, replica_router
+from app.permissions import DEFAULT_ROLE, ROLES
+from app.services.user.cache import user_cache
+from app.services.user.invalidation import notify_user_changed
+
+EXPORT_COLUMNS = [
+    "tg_user_id",
+    "tg_username",
+    "name",
+    "email",
+    "role",
+    "is_active",
+    "last_seen_at",
+    "message_count",
+    "created_at",
+    "updated_at",
+]
+REQUIRED_IMPORT_COLUMNS = {"tg_user_id", "name", "email"}
+
+EXPORT_QUERY = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM users ORDER BY created_at, id"
+
+STAGING_TABLE = "users_import"
+
+# One set-based upsert from the staging table. Rows whose email belongs to
+# another active account (in the table or elsewhere in the file) or with an unknown
+# role are skipped instead of failing the whole import.
+UPSERT_QUERY = f"""
+WITH upserted AS (
+    INSERT INTO users (tg_user_id, tg_username, name, email, role, is_active)
+    SELECT DISTINCT ON (s.tg_user_id)
+        s.tg_user_id,
+        coalesce(s.tg_username, ''),
+        s.name,
+        s.email,
+        coalesce(nullif(s.role, ''), '{DEFAULT_ROLE}'),
+        coalesce(nullif(s.is_active, '')::boolean, true)
+    FROM {STAGING_TABLE} s
+    WHERE s.tg_user_id IS NOT NULL
+      AND s.name IS NOT NULL
+      AND s.email IS NOT NULL
+      AND coalesce(nullif(s.role, ''), '{DEFAULT_ROLE}') IN ({", ".join(f"'{role}'" for role in ROLES)})
+      AND NOT EXISTS (
+          SELECT 1 FROM users u
+          WHERE u.email = s.email AND u.tg_user_id <> s.tg_user_id AND u.is_active
+      )
+      AND NOT EXISTS (
+          SELECT 1 FROM {STAGING_TABLE} d WHERE d.email = s.email AND d.tg_user_id <> s.tg_user_id
+      )
+    ORDER BY s.tg_user_id
+    ON CONFLICT (tg_user_id) DO UPDATE SET
+        tg_username = excluded.tg_username,
+        name = excluded.name,
+        email = excluded.email,
+        role = excluded.role,
+        is_active = excluded.is_active,
+        updated_at = current_timestamp(0)
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+
+
+def _copy_row_count(status: str) -> int:
+    # asyncpg returns the command tag, e.g. "COPY 1234"
+    return int(status.split()[-1])
+
+
+async def export_users_csv(path: str) -> tuple[int, float]:
+    """Write all users to `path` as CSV. Returns (rows, rows per second)."""
+    started_at = time.perf_counter()
+
+    async with async_engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        status = await raw_conn.driver_connection.copy_from_query(
+            EXPORT_QUERY, output=path, format="csv", header=True
+        )
+
+    rows = _copy_row_count(status)
+    return rows, rows / max(time.perf_counter() - started_at, 1e-9)
+
+
+def read_import_columns(path: str) -> list[str]:
+    """CSV header of an import file, validated against the users columns."""
+    with open(path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+
+    columns = [column.strip() for column in header]
+    unknown = set(columns) - set(EXPORT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+    missing = REQUIRED_IMPORT_COLUMNS - set(columns)
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    return columns
+
+
+async def import_users_csv(path: str) -> dict:
+    """
+    COPY the CSV at `path` into a temp staging table, then upsert it into users
+    by tg_user_id in a single statement. Returns counts and rows per second.
+    """
+    columns = read_import_columns(path)
+    started_at = time.perf_counter()
+
+    async with async_engine.begin() as conn:
+        await conn.exec_driver_sql(
+            f"CREATE TEMP TABLE {STAGING_TABLE} ("
+            + ", ".join(f"{column} text" for column in EXPORT_COLUMNS)
+            + ") ON COMMIT DROP"
+        )
+        raw_conn = await conn.get_raw_connection()
+        status = await raw_conn.driver_connection.copy_to_table(
+            STAGING_TABLE, source=path, columns=columns, format="csv", header=True
+        )
+        result = await conn.exec_driver_sql(UPSERT_QUERY)
+        inserted, updated = result.one()
+        await notify_user_changed(conn)
+
+    replica_router.pin_all()
+    user_cache.clear()
+
+    rows = _copy_row_count(status)
+    return {
+        "rows": rows,
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": rows - inserted - updated,
+        "rows_per_sec": rows / max(time.perf_counter() - started_at, 1e-9),
+    }
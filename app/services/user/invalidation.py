@@ -0,0 +1,109 @@
+"""
+Cross-process invalidation of `user_cache` over Postgres LISTEN/NOTIFY.
+
+Every user write NOTIFYs in its own transaction, so other processes (workers,
+webhook replicas) drop their cached copy on commit, e.g. a revoked admin role
+stops working everywhere at once instead of after USER_CACHE_TTL.
+"""
+
+import asyncio
+import os
+
+import asyncpg
+from sqlalchemy import ARRAY, String, bindparam, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.database import async_engine, replica_router
+from app.services.user.cache import user_cache
+
+CHANNEL = "user_cache"
+# Payload meaning "drop everything", e.g. after a bulk import
+ALL_USERS = "*"
+RECONNECT_DELAY = 5
+
+# Distinguishes our own notifications, which need no handling
+_PROCESS_ID = f"{os.getpid()}-{id(user_cache)}"
+
+
+async def notify_user_changed(
+    db: AsyncSession | AsyncConnection, tg_user_id: str = ALL_USERS
+) -> None:
+    """Queue a notification; Postgres delivers it when `db` commits."""
+    await db.execute(select(func.pg_notify(CHANNEL, f"{_PROCESS_ID}:{tg_user_id}")))
+
+
+async def notify_users_changed(
+    db: AsyncSession | AsyncConnection, tg_user_ids: list[str]
+) -> None:
+    """`notify_user_changed` for many users in one statement."""
+    if not tg_user_ids:
+        return
+    ids = func.unnest(bindparam("tg_user_ids", tg_user_ids, type_=ARRAY(String)))
+    ids = ids.table_valued("tg_user_id")
+    await db.execute(
+        select(func.pg_notify(CHANNEL, func.concat(f"{_PROCESS_ID}:", ids.c.tg_user_id)))
+    )
+
+
+class UserCacheListener:
+    """LISTENs on a dedicated connection (outside the pool) and reconnects on loss."""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str) -> None:
+        sender, _, tg_user_id = payload.partition(":")
+        if sender == _PROCESS_ID:
+            return
+        # Until the replicas have caught up, the next lookup must read the
+        # primary or it may cache the row we are dropping
+        if tg_user_id == ALL_USERS:
+            replica_router.pin_all()
+            user_cache.clear()
+        else:
+            replica_router.pin(tg_user_id)
+            user_cache.invalidate(tg_user_id)
+
+    async def _run(self) -> None:
+        url = async_engine.url
+        while True:
+            try:
+                conn = await asyncpg.connect(
+                    user=url.username,
+                    password=url.password,
+                    host=url.host,
+                    port=url.port,
+                    database=url.database,
+                )
+            except (OSError, asyncpg.PostgresError) as e:
+                print(f"User cache listener failed to connect: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda _: closed.set())
+            try:
+                await conn.add_listener(CHANNEL, self._on_notify)
+                # Notifications sent while we weren't listening are lost
+                replica_router.pin_all()
+                user_cache.clear()
+                await closed.wait()
+                print("User cache listener disconnected, reconnecting...")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                # e.g. the connection dropped right after connecting
+                print(f"User cache listener failed, reconnecting: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                await conn.close()
+
+
+user_cache_listener = UserCacheListener()
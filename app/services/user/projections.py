@@ -0,0 +1,47 @@
+"""
+Compact read-only views of `users` for list and search queries.
+
+They select only the columns a view renders, straight from the table, so rows
+skip SQLModel validation and the session's identity map and come back as
+plain named tuples. Use the full `User` model when the row is written back or
+cached.
+"""
+
+from datetime import datetime
+from typing import NamedTuple
+from uuid import UUID
+
+from sqlalchemy import Column, Result
+
+from app.models import User
+
+# Projections are built on the Core table: ORM attributes anywhere in the
+# statement would route it through the ORM compile and loading path
+users_table = User.__table__
+
+
+class UserListItem(NamedTuple):
+    """A row of the admin user list; id/created_at are its keyset cursor."""
+
+    id: UUID
+    created_at: datetime
+    tg_user_id: str
+    tg_username: str
+    name: str
+    role: str
+
+
+class UserSearchItem(NamedTuple):
+    tg_user_id: str
+    tg_username: str
+    name: str
+    email: str
+
+
+def columns(record: type[NamedTuple]) -> list[Column]:
+    """The `users` columns backing `record`, in field order."""
+    return [users_table.c[field] for field in record._fields]
+
+
+def rows_as(record: type[NamedTuple], result: Result) -> list:
+    return [record._make(row) for row in result]
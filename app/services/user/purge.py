@@ -0,0 +1,88 @@
+"""
+Background hard delete of soft-deleted (inactive) users.
+
+Every USER_PURGE_INTERVAL seconds, users inactive for at least
+USER_PURGE_AFTER seconds are deleted USER_PURGE_BATCH rows per transaction,
+pausing USER_PURGE_PAUSE seconds between batches, so locks stay short and
+autovacuum can keep up. Rows are claimed with SKIP LOCKED, so every process
+can run the job without waiting on the others.
+"""
+
+import asyncio
+import os
+from dotenv import load_dotenv
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.database import async_engine
+
+load_dotenv()
+USER_PURGE_INTERVAL = float(os.getenv("USER_PURGE_INTERVAL", "3600"))
+USER_PURGE_AFTER = float(os.getenv("USER_PURGE_AFTER", "86400"))
+USER_PURGE_BATCH = int(os.getenv("USER_PURGE_BATCH", "1000"))
+USER_PURGE_PAUSE = float(os.getenv("USER_PURGE_PAUSE", "0.5"))
+
+# Uses ix_users_inactive_updated_at; updated_at is when the user was deleted
+PURGE_QUERY = text(
+    """
+DELETE FROM users WHERE id IN (
+    SELECT id FROM users
+    WHERE NOT is_active AND updated_at < now() - make_interval(secs => :after)
+    ORDER BY updated_at
+    LIMIT :batch
+    FOR UPDATE SKIP LOCKED
+)
+"""
+)
+
+
+class UserPurger:
+    def __init__(
+        self,
+        interval: float = USER_PURGE_INTERVAL,
+        after: float = USER_PURGE_AFTER,
+        batch_size: int = USER_PURGE_BATCH,
+        pause: float = USER_PURGE_PAUSE,
+    ):
+        self.interval = interval
+        self.after = after
+        self.batch_size = batch_size
+        self.pause = pause
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                purged = await self.purge()
+            except (OSError, DBAPIError) as e:
+                print(f"User purge failed, retrying in {self.interval:g}s: {e}")
+            else:
+                if purged:
+                    print(f"Purged {purged} deleted user(s)")
+            await asyncio.sleep(self.interval)
+
+    async def purge(self) -> int:
+        """Delete every purgeable user, one batch per transaction; returns the count."""
+        purged = 0
+        while True:
+            async with async_engine.begin() as conn:
+                result = await conn.execute(
+                    PURGE_QUERY, {"after": self.after, "batch": self.batch_size}
+                )
+            purged += result.rowcount
+            if result.rowcount < self.batch_size:
+                return purged
+            await asyncio.sleep(self.pause)
+
+
+user_purger = UserPurger()
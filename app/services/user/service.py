@@ -1,39 +1,156 @@
+from datetime import datetime
+from typing import AsyncIterator
+from uuid import UUID
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import (
+    ARRAY,
+    Date,
+    Integer,
+    String,
+    any_,
+    bindparam,
+    cast,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.database import db_session, read_session, replica_router
+from app.models import DailyRegistrations, User, UserCounter
+from app.permissions import DEFAULT_ROLE, ROLES
+from app.services.user.cache import MISS, user_cache
+from app.services.user.invalidation import notify_user_changed, notify_users_changed
+from app.services.user.projections import (
+    UserListItem,
+    UserSearchItem,
+    columns,
+    rows_as,
+    users_table,
+)
+
+USER_NOT_FOUND = "User not found"
+USER_EXISTS = "User already registered"
+EMAIL_IN_USE = "Email already in use by another user"
+UNKNOWN_ROLE = f"Unknown role, expected one of: {', '.join(ROLES)}"
+
+CURRENT_TIMESTAMP = text("current_timestamp(0)")
+
+
+def _conflict_error(e: IntegrityError) -> Exception:
+    """Map a unique-constraint violation on users to the service's ValueError."""
+    # asyncpg's UniqueViolationError carries the index name, e.g. ix_users_email_active
+    constraint = getattr(e.orig.__cause__, "constraint_name", None) or str(e.orig)
+
+    if "email" in constraint:
+        return ValueError(EMAIL_IN_USE)
+    if "tg_user_id" in constraint:
+        return ValueError(USER_EXISTS)
+    return e
+
+
+def _detached(db: AsyncSession, user: User | None) -> User | None:
+    """
+    Detach `user` before it is cached or returned: it outlives the session,
+    and a rollback of the session (e.g. the update's unit of work) would
+    otherwise expire it and break every later update reading it from the cache.
+    """
+    if user is not None:
+        db.expunge(user)
+    return user
 
-from app.database import db_session
-from app.models import User
+
+def _id_array(tg_user_ids: list[str]):
+    # Sorted, so concurrent bulk updates lock rows in the same order; one
+    # array parameter keeps a single prepared statement for any number of ids
+    return bindparam("tg_user_ids", sorted(set(tg_user_ids)), type_=ARRAY(String))
 
 
 class UserService:
 
     @staticmethod
     async def get_user_by_tg_user_id(tg_user_id: str) -> User | None:
-        async for db in db_session():
+        cached = user_cache.get(tg_user_id)
+        if cached is not MISS:
+            return cached
+
+        generation = user_cache.generation
+        async for db in read_session(tg_user_id):
             user_record = await db.execute(
-                select(User).where(User.tg_user_id == tg_user_id)
+                select(User).where(User.tg_user_id == tg_user_id, User.is_active)
             )
-            user = user_record.scalar_one_or_none()
+            user = _detached(db, user_record.scalar_one_or_none())
+            user_cache.fill(tg_user_id, user, generation)
             return user
 
     @staticmethod
     async def get_user_by_email(email: str) -> User | None:
-        async for db in db_session():
-            user_record = await db.execute(select(User).where(User.email == email))
-            user = user_record.scalar_one_or_none()
+        cached = user_cache.get_by_email(email)
+        if cached is not MISS:
+            return cached
+
+        generation = user_cache.generation
+        async for db in read_session(email):
+            user_record = await db.execute(
+                select(User).where(User.email == email, User.is_active)
+            )
+            user = _detached(db, user_record.scalar_one_or_none())
+            # Read by email, so a replica may have served a user whose
+            # tg_user_id is pinned: only cache it once the pin has expired
+            if user and not replica_router.is_pinned(user.tg_user_id):
+                user_cache.fill(user.tg_user_id, user, generation)
             return user
 
     @staticmethod
     async def create_user(
         tg_user_id: str, tg_username: str, name: str, email: str
     ) -> User:
+        statement = insert(User).values(
+            tg_user_id=tg_user_id,
+            tg_username=tg_username,
+            name=name,
+            email=email,
+        )
+        # A deleted (inactive) user registering again starts afresh
+        statement = statement.on_conflict_do_update(
+            index_elements=[User.tg_user_id],
+            set_={
+                "tg_username": statement.excluded.tg_username,
+                "name": statement.excluded.name,
+                "email": statement.excluded.email,
+                "role": DEFAULT_ROLE,
+                "is_active": True,
+                "created_at": CURRENT_TIMESTAMP,
+                "updated_at": CURRENT_TIMESTAMP,
+            },
+            where=~User.is_active,
+        )
+
         async for db in db_session():
-            user = User(
-                tg_user_id=tg_user_id, tg_username=tg_username, name=name, email=email
-            )
-            db.add(user)
+            try:
+                # A savepoint, so a taken email only undoes this statement and
+                # not the rest of the update's unit of work
+                async with db.begin_nested():
+                    user_record = await db.execute(statement.returning(User))
+                    user = _detached(db, user_record.scalar_one_or_none())
+                    # Other processes may have cached "not registered"
+                    await notify_user_changed(db, tg_user_id)
+            except IntegrityError as e:
+                raise _conflict_error(e)
             await db.commit()
-            await db.refresh(user)
+
+            if not user:
+                raise ValueError(USER_EXISTS)
+
+            replica_router.pin(tg_user_id, email)
+            user_cache.set(user)
             return user
 
     @staticmethod
@@ -42,74 +159,259 @@ class UserService:
         name: str | None = None,
         email: str | None = None,
     ) -> User:
-        async for db in db_session():
-            user_record = await db.execute(
-                select(User).where(User.tg_user_id == tg_user_id)
-            )
-            user = user_record.scalar_one_or_none()
+        values = {}
+        if name:
+            values["name"] = name
+        if email:
+            values["email"] = email
 
+        if not values:
+            user = await UserService.get_user_by_tg_user_id(tg_user_id)
             if not user:
-                raise ValueError("User not found")
-
-            email_user_record = await db.execute(
-                select(User).where(User.email == email)
-            )
-            email_exists = email_user_record.scalar_one_or_none()
+                raise ValueError(USER_NOT_FOUND)
+            return user
 
-            if email and email_exists and email_exists.id != user.id:
-                raise ValueError("Email already in use by another user")
+        async for db in db_session():
+            try:
+                async with db.begin_nested():
+                    user_record = await db.execute(
+                        update(User)
+                        .where(User.tg_user_id == tg_user_id, User.is_active)
+                        .values(**values)
+                        .returning(User)
+                    )
+                    user = _detached(db, user_record.scalar_one_or_none())
+                    await notify_user_changed(db, tg_user_id)
+            except IntegrityError as e:
+                raise _conflict_error(e)
+            await db.commit()
 
-            if name:
-                user.name = name
-            if email:
-                user.email = email
+            if not user:
+                raise ValueError(USER_NOT_FOUND)
 
-            db.add(user)
-            await db.commit()
-            await db.refresh(user)
+            replica_router.pin(tg_user_id, email)
+            user_cache.set(user)
             return user
 
     @staticmethod
     async def delete_user(tg_user_id: str) -> bool:
+        if not await UserService.delete_users([tg_user_id]):
+            raise ValueError(USER_NOT_FOUND)
+        return True
+
+    @staticmethod
+    async def delete_users(tg_user_ids: list[str]) -> list[str]:
+        """
+        Soft-delete users in one UPDATE: they are marked inactive, look
+        unregistered from then on, and are removed for good by the purge job.
+        Returns the tg_user_ids actually deleted.
+        """
         async for db in db_session():
-            user_record = await db.execute(
-                select(User).where(User.tg_user_id == tg_user_id)
+            deleted_record = await db.execute(
+                update(User)
+                .where(User.tg_user_id == any_(_id_array(tg_user_ids)), User.is_active)
+                .values(is_active=False)
+                .returning(User.tg_user_id)
             )
-            user = user_record.scalar_one_or_none()
+            deleted = list(deleted_record.scalars().all())
+            await notify_users_changed(db, deleted)
+            await db.commit()
 
-            if user:
-                await db.delete(user)
-                await db.commit()
-                return True
-            else:
-                raise ValueError("User not found")
+            replica_router.pin(*deleted)
+            for tg_user_id in deleted:
+                user_cache.invalidate(tg_user_id)
+            return deleted
 
     @staticmethod
-    async def get_all_users_paginated(page: int, per_page: int) -> list[User]:
-        offset = (page - 1) * per_page
-        async for db in db_session():
+    async def get_all_users_paginated(offset: int, limit: int) -> list[UserListItem]:
+        # Same (created_at, id) order as get_users_page, so an OFFSET jump and
+        # the cursor pages that follow it agree on ties
+        c = users_table.c
+        async for db in read_session():
             users = await db.execute(
-                select(User)
+                select(*columns(UserListItem))
+                .where(c.is_active)
+                .order_by(c.created_at.desc(), c.id.desc())
                 .offset(offset)
-                .limit(per_page)
-                .order_by(User.created_at.desc())
+                .limit(limit)
             )
-            return users.scalars().all()
+            return rows_as(UserListItem, users)
+
+    @staticmethod
+    async def get_users_page(
+        per_page: int,
+        cursor: tuple[datetime, UUID] | None = None,
+        backwards: bool = False,
+    ) -> tuple[list[UserListItem], bool]:
+        """
+        Keyset pagination over users, newest first, ordered by (created_at, id).
+
+        `cursor` is the (created_at, id) of the last user on the current page when
+        moving forward, or of the first user when moving `backwards`. Returns the
+        page and whether more rows exist in the direction of travel.
+        """
+        c = users_table.c
+        key = tuple_(c.created_at, c.id)
+        query = select(*columns(UserListItem)).where(c.is_active)
+
+        if backwards:
+            if cursor:
+                query = query.where(key > tuple_(*cursor))
+            query = query.order_by(c.created_at.asc(), c.id.asc())
+        else:
+            if cursor:
+                query = query.where(key < tuple_(*cursor))
+            query = query.order_by(c.created_at.desc(), c.id.desc())
+
+        async for db in read_session():
+            users_record = await db.execute(query.limit(per_page + 1))
+            users = rows_as(UserListItem, users_record)
+
+            has_more = len(users) > per_page
+            users = users[:per_page]
+            if backwards:
+                users.reverse()
+            return users, has_more
+
+    @staticmethod
+    async def search_users(text: str, limit: int = 10) -> list[UserSearchItem]:
+        """
+        Fuzzy search over name, email and username, best matches first.
+
+        `text <% column` (word similarity) is answered from the pg_trgm GIN
+        indexes, so partial names/emails match without scanning the table.
+        """
+        c = users_table.c
+        searched = (c.name, c.email, c.tg_username)
+        query = literal(text)
+
+        async for db in read_session():
+            users = await db.execute(
+                select(*columns(UserSearchItem))
+                .where(c.is_active, or_(*(query.op("<%")(column) for column in searched)))
+                .order_by(
+                    func.greatest(
+                        *(func.word_similarity(query, column) for column in searched)
+                    ).desc()
+                )
+                .limit(limit)
+            )
+            return rows_as(UserSearchItem, users)
+
+    @staticmethod
+    async def iter_active_user_ids(
+        after: str | None = None, batch_size: int = 1000
+    ) -> AsyncIterator[list[str]]:
+        """
+        Yield active users' tg_user_ids in tg_user_id order, `batch_size` at a
+        time, starting after `after`. Each batch is streamed through a
+        server-side cursor in its own short transaction, so callers can take
+        as long as they like between batches without holding one open.
+        """
+        while True:
+            query = (
+                select(User.tg_user_id)
+                .where(User.is_active)
+                .order_by(User.tg_user_id)
+                .limit(batch_size)
+                .execution_options(yield_per=batch_size)
+            )
+            if after is not None:
+                query = query.where(User.tg_user_id > after)
+
+            batch = []
+            async for db in read_session():
+                async for tg_user_id in await db.stream_scalars(query):
+                    batch.append(tg_user_id)
+                break
+
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            after = batch[-1]
 
     @staticmethod
     async def admin_update_user_role(tg_user_id: str, role: str) -> User:
+        if role not in ROLES:
+            raise ValueError(UNKNOWN_ROLE)
+
         async for db in db_session():
             user_record = await db.execute(
-                select(User).where(User.tg_user_id == tg_user_id)
+                update(User)
+                .where(User.tg_user_id == tg_user_id, User.is_active)
+                .values(role=role)
+                .returning(User)
             )
-            user = user_record.scalar_one_or_none()
+            user = _detached(db, user_record.scalar_one_or_none())
+            # Role changes must reach the caches of every process
+            await notify_user_changed(db, tg_user_id)
+            await db.commit()
 
             if not user:
-                raise ValueError("User not found")
+                raise ValueError(USER_NOT_FOUND)
+
+            replica_router.pin(tg_user_id)
+            user_cache.set(user)
+            return user
 
-            user.role = role
+    @staticmethod
+    async def admin_update_users_role(tg_user_ids: list[str], role: str) -> list[str]:
+        """Set the role of many users in one UPDATE; returns the tg_user_ids updated."""
+        if role not in ROLES:
+            raise ValueError(UNKNOWN_ROLE)
 
-            db.add(user)
+        async for db in db_session():
+            updated_record = await db.execute(
+                update(User)
+                .where(User.tg_user_id == any_(_id_array(tg_user_ids)), User.is_active)
+                .values(role=role)
+                .returning(User.tg_user_id)
+            )
+            updated = list(updated_record.scalars().all())
+            await notify_users_changed(db, updated)
             await db.commit()
-            await db.refresh(user)
-            return user
+
+            replica_router.pin(*updated)
+            for tg_user_id in updated:
+                user_cache.invalidate(tg_user_id)
+            return updated
+
+    @staticmethod
+    async def get_user_stats(days: int = 7) -> dict:
+        """
+        User totals from the trigger-maintained counters plus registrations
+        for the last `days` days; constant time however many users there are.
+        """
+        # Days come from the database's clock, in the session time zone the
+        # triggers bucket created_at::date by, not from this host's
+        today = func.current_date()
+        day = cast(
+            func.generate_series(
+                today - cast(days - 1, Integer), today, literal_column("interval '1 day'")
+            ),
+            Date,
+        ).label("day")
+        window = select(day).subquery()
+        registrations_query = (
+            select(window.c.day, func.coalesce(DailyRegistrations.registrations, 0))
+            .outerjoin(DailyRegistrations, DailyRegistrations.day == window.c.day)
+            .order_by(window.c.day)
+        )
+
+        async for db in read_session():
+            counter_rows = await db.execute(select(UserCounter.name, UserCounter.value))
+            registration_rows = await db.execute(registrations_query)
+            counters = dict(counter_rows.all())
+
+            return {
+                "total": counters.get("total", 0),
+                "deleted": counters.get("deleted", 0),
+                "roles": {
+                    name.removeprefix("role:"): value
+                    for name, value in sorted(counters.items())
+                    if name.startswith("role:") and value
+                },
+                "registrations": [tuple(row) for row in registration_rows],
+            }
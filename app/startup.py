@@ -0,0 +1,29 @@
+"""
+Startup-time breakdown, so slow phases of a (re)start show up in the logs.
+Only imports the standard library: main.py loads it before everything else.
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started_at))
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.started_at
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases)
+        return f"Started in {total * 1000:.0f} ms ({phases})"
+
+
+startup_timer = StartupTimer()
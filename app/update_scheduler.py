@@ -0,0 +1,163 @@
+"""
+Inbound update scheduler.
+
+Installed as the first outer middleware on `dp.update`, it bounds how many
+handlers run at once (UPDATE_CONCURRENCY, by default half the DB pool, so
+handlers don't pile up on the pool) and runs each user's updates one at a time
+in arrival order, so e.g. two quick messages in the registration flow can't
+race. Updates accepted but not finished are capped at UPDATE_MAX_PENDING: the
+polling loop stops fetching (`tasks_concurrency_limit`) and the webhook holds
+its HTTP response until there is room. On shutdown, accepted updates are given
+UPDATE_SHUTDOWN_TIMEOUT seconds to finish.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict
+from dotenv import load_dotenv
+
+from aiogram import BaseMiddleware
+from aiogram.types import Chat, TelegramObject, User as TelegramUser
+
+from app.database import DATABASE_MAX_OVERFLOW, DATABASE_POOL_SIZE
+from app.metrics import update_queue_depth, update_wait, updates_in_flight
+
+load_dotenv()
+# A handler can hold its unit-of-work connection while FSM storage or CSV I/O
+# checks out a second one; with one slot per pooled connection every handler
+# could hold one and wait on the pool for another until DATABASE_POOL_TIMEOUT
+UPDATE_CONCURRENCY = int(
+    os.getenv(
+        "UPDATE_CONCURRENCY", str(max(1, (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW) // 2))
+    )
+)
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1000"))
+UPDATE_SHUTDOWN_TIMEOUT = float(os.getenv("UPDATE_SHUTDOWN_TIMEOUT", "30"))
+
+
+def serial_key(data: Dict[str, Any]) -> int | None:
+    """Updates with the same key run one at a time: the sender, else the chat."""
+    from_user: TelegramUser | None = data.get("event_from_user")
+    if from_user is not None:
+        return from_user.id
+    chat: Chat | None = data.get("event_chat")
+    if chat is not None:
+        return chat.id
+    return None
+
+
+class UpdateScheduler(BaseMiddleware):
+    def __init__(
+        self,
+        concurrency: int = UPDATE_CONCURRENCY,
+        max_pending: int = UPDATE_MAX_PENDING,
+        shutdown_timeout: float = UPDATE_SHUTDOWN_TIMEOUT,
+    ):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.shutdown_timeout = shutdown_timeout
+
+        self._slots = asyncio.Semaphore(concurrency)
+        # A key is present while one of its updates runs; the deque holds the
+        # updates waiting behind it, in arrival order
+        self._queues: dict[int, deque[asyncio.Future]] = {}
+        self._accepted = 0
+        self._running = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._room = asyncio.Event()
+        self._room.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        key = serial_key(data)
+        started_at = time.perf_counter()
+        self._enter()
+        try:
+            await self._acquire_turn(key)
+            try:
+                async with self._slots:
+                    update_wait.observe(time.perf_counter() - started_at)
+                    self._running += 1
+                    self._update_gauges()
+                    try:
+                        return await handler(event, data)
+                    finally:
+                        self._running -= 1
+            finally:
+                self._release_turn(key)
+        finally:
+            self._leave()
+
+    async def wait_for_room(self) -> None:
+        """Block while UPDATE_MAX_PENDING updates are accepted but not finished."""
+        while self._accepted >= self.max_pending:
+            self._room.clear()
+            await self._room.wait()
+
+    async def drain(self) -> None:
+        # Let update tasks spawned just before polling stopped reach __call__
+        await asyncio.sleep(0)
+        if not self._accepted:
+            return
+        print(f"Waiting for {self._accepted} update(s) to finish...")
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            print(f"{self._accepted} update(s) unfinished after {self.shutdown_timeout:g}s")
+
+    def _enter(self) -> None:
+        self._accepted += 1
+        self._idle.clear()
+        self._update_gauges()
+
+    def _leave(self) -> None:
+        self._accepted -= 1
+        if self._accepted < self.max_pending:
+            self._room.set()
+        if not self._accepted:
+            self._idle.set()
+        self._update_gauges()
+
+    async def _acquire_turn(self, key: int | None) -> None:
+        if key is None:
+            return
+        queue = self._queues.get(key)
+        if queue is None:
+            self._queues[key] = deque()
+            return
+
+        turn = asyncio.get_running_loop().create_future()
+        queue.append(turn)
+        try:
+            await turn
+        except asyncio.CancelledError:
+            # A cancelled turn stays queued and is skipped by _release_turn;
+            # one handed over just before the cancellation is passed on
+            if not turn.cancelled():
+                self._release_turn(key)
+            raise
+
+    def _release_turn(self, key: int | None) -> None:
+        if key is None:
+            return
+        queue = self._queues[key]
+        while queue:
+            turn = queue.popleft()
+            if not turn.done():
+                turn.set_result(None)
+                return
+        del self._queues[key]
+
+    def _update_gauges(self) -> None:
+        update_queue_depth.set(value=self._accepted - self._running)
+        updates_in_flight.set(value=self._running)
+
+
+update_scheduler = UpdateScheduler()
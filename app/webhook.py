@@ -0,0 +1,89 @@
+import asyncio
+import os
+import signal
+import time
+from dotenv import load_dotenv
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from app.middlewares.latency import update_received_at
+from app.update_scheduler import update_scheduler
+
+load_dotenv()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Public https URL Telegram should call; leave unset to test locally by
+# POSTing Update JSON to http://WEBHOOK_HOST:WEBHOOK_PORT/WEBHOOK_PATH
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+
+@web.middleware
+async def stamp_received_at(request: web.Request, handler):
+    update_received_at.set(time.perf_counter())
+    return await handler(request)
+
+
+@web.middleware
+async def backpressure(request: web.Request, handler):
+    # Holding the response while the update scheduler is full keeps Telegram
+    # (at most WEBHOOK_MAX_CONNECTIONS requests at a time) from sending more
+    await update_scheduler.wait_for_room()
+    return await handler(request)
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    app = web.Application(middlewares=[stamp_received_at, backpressure])
+
+    # Updates are handled in background tasks, so slow handlers don't hold up
+    # the HTTP response and independent updates run concurrently.
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    app = create_webhook_app(bot, dp)
+
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    else:
+        print("WEBHOOK_BASE_URL not set, skipping set_webhook (local mode)")
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    await site.start()
+    print(f"Listening for updates on http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    try:
+        await stopping.wait()
+        print("Stopping webhook, draining updates...")
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        # Stop accepting updates, let the accepted ones finish, then run the
+        # dispatcher shutdown hooks (activity flush, broadcast checkpoint, ...)
+        await site.stop()
+        await update_scheduler.drain()
+        await runner.cleanup()
+        await bot.session.close()
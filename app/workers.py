@@ -0,0 +1,239 @@
+"""
+Multi-process update processing.
+
+One ingestion process receives updates (long polling or webhook) and hands the
+raw JSON to N worker processes, each running its own Bot + Dispatcher. Updates
+are partitioned by user (or chat) id, so every user's updates are handled by
+the same worker in the order they arrived, which keeps FSM flows such as
+registration consistent while different users are spread across cores.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import secrets
+import signal
+from typing import Any
+from dotenv import load_dotenv
+
+from aiohttp import ClientSession, ClientTimeout, web
+from aiogram import Bot
+
+from app.webhook import (
+    WEBHOOK_BASE_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+)
+from app.update_scheduler import UPDATE_CONCURRENCY
+
+load_dotenv()
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+# Max updates a single worker processes concurrently (for different users);
+# workers take the place of the update scheduler, so the same pool-based default
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", str(UPDATE_CONCURRENCY)))
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "30"))
+POLLING_TIMEOUT = 30
+
+
+def partition_key(update: dict[str, Any]) -> int:
+    """User id of the update's sender, falling back to the chat id."""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        if "from" in value:
+            return value["from"]["id"]
+        if "user" in value:
+            return value["user"]["id"]
+        chat = value.get("chat") or value.get("message", {}).get("chat")
+        if chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+async def _process_updates(index: int, queue: multiprocessing.Queue) -> None:
+    from app.bot_app import create_bot, create_dispatcher
+    from app.metrics import start_metrics_server
+
+    # Metrics are per process: worker N serves them on METRICS_PORT + N + 1
+    await start_metrics_server(port_offset=index + 1)
+
+    bot = create_bot()
+    # The chains and slots below already order and bound updates; scheduling
+    # them again in the dispatcher would double every limit
+    dp = create_dispatcher(scheduling=False)
+    loop = asyncio.get_running_loop()
+
+    # Last pending task per partition key; a new update for the same key
+    # waits for it, so per-user order is kept while other users run freely.
+    chains: dict[int, asyncio.Task] = {}
+    # Slots are only taken once an update's turn has come, so one busy user's
+    # queued updates can't hold them and stall everyone else
+    slots = asyncio.Semaphore(WORKER_CONCURRENCY)
+    # Bounds updates taken off the queue but not finished (waiting or running)
+    backlog = asyncio.Semaphore(WORKER_QUEUE_SIZE)
+
+    async def handle(key: int, update: dict, previous: asyncio.Task | None) -> None:
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            async with slots:
+                await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            print(f"Worker failed to process update {update.get('update_id')}: {e}")
+        finally:
+            backlog.release()
+            if chains.get(key) is asyncio.current_task():
+                del chains[key]
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+
+            update = json.loads(raw)
+            key = partition_key(update)
+            await backlog.acquire()
+            chains[key] = asyncio.create_task(handle(key, update, chains.get(key)))
+
+        # Drain in-flight updates before shutting down
+        if chains:
+            await asyncio.wait(list(chains.values()))
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+
+def worker_main(index: int, queue: multiprocessing.Queue) -> None:
+    # Shutdown is driven by the ingestion process through a sentinel, so a
+    # Ctrl+C or SIGTERM delivered to the whole process group must not kill
+    # workers mid-update.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    print(f"Worker {index} started (pid {os.getpid()})")
+    asyncio.run(_process_updates(index, queue))
+    print(f"Worker {index} stopped")
+
+
+class UpdateFanout:
+    """Routes raw updates from the ingestion process to worker queues."""
+
+    def __init__(self, num_workers: int):
+        ctx = multiprocessing.get_context("spawn")
+        self.queues = [ctx.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(num_workers)]
+        self.processes = [
+            ctx.Process(target=worker_main, args=(index, queue), name=f"bot-worker-{index}")
+            for index, queue in enumerate(self.queues)
+        ]
+
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+
+    async def submit(self, update: dict[str, Any], raw: str | None = None) -> None:
+        queue = self.queues[hash(partition_key(update)) % len(self.queues)]
+        # Blocks (off the event loop) while the worker is saturated, which in
+        # turn slows down ingestion instead of buffering without bound.
+        await asyncio.get_running_loop().run_in_executor(
+            None, queue.put, raw or json.dumps(update)
+        )
+
+    async def stop(self) -> None:
+        loop = asyncio.get_running_loop()
+        for queue in self.queues:
+            await loop.run_in_executor(None, queue.put, None)
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, WORKER_SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                print(f"{process.name} did not drain in time, killing")
+                process.kill()
+
+
+async def _poll_updates(bot: Bot, fanout: UpdateFanout) -> None:
+    # Raw getUpdates: only json.loads here, the pydantic models are built in
+    # the workers.
+    await bot.delete_webhook()
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    offset = None
+
+    async with ClientSession(timeout=ClientTimeout(total=POLLING_TIMEOUT + 10)) as http:
+        while True:
+            params = {"timeout": POLLING_TIMEOUT}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                async with http.get(url, params=params) as response:
+                    payload = await response.json()
+            except (asyncio.TimeoutError, OSError) as e:
+                print(f"getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if not payload.get("ok"):
+                print(f"getUpdates error: {payload.get('description')}")
+                await asyncio.sleep(payload.get("parameters", {}).get("retry_after", 1))
+                continue
+
+            for update in payload["result"]:
+                await fanout.submit(update)
+                offset = update["update_id"] + 1
+
+
+async def _serve_webhook(bot: Bot, fanout: UpdateFanout) -> None:
+    async def handle(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and not secrets.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), WEBHOOK_SECRET
+        ):
+            return web.Response(body="Unauthorized", status=401)
+
+        raw = await request.text()
+        await fanout.submit(json.loads(raw), raw)
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+    print(f"Listening for updates on http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_workers(bot: Bot, num_workers: int, run_mode: str) -> None:
+    fanout = UpdateFanout(num_workers)
+    fanout.start()
+
+    loop = asyncio.get_running_loop()
+    ingest = asyncio.create_task(
+        _serve_webhook(bot, fanout)
+        if run_mode == "webhook"
+        else _poll_updates(bot, fanout)
+    )
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, ingest.cancel)
+
+    try:
+        await ingest
+    except asyncio.CancelledError:
+        pass
+    finally:
+        print("Stopping ingestion, draining workers...")
+        await fanout.stop()
+        await bot.session.close()
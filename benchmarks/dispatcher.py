@@ -0,0 +1,300 @@
+"""
+Offline load test of the real Dispatcher (start, account and manage_users
+routers). Synthetic updates go through `feed_update` with a fake Bot session,
+so no requests reach Telegram; the database is used for real. Per-user
+throttling is disabled: the admin scenario sends every update as one user,
+and throttled (dropped) updates would be measured instead of handled ones.
+
+Run against a LOCAL database only, it inserts (and afterwards deletes) users:
+
+    python -m benchmarks.dispatcher --users 500 --concurrency 20 --output results.json
+    python -m benchmarks.dispatcher --compare results.json
+
+Results (throughput, p50/p99 latency, DB queries per update) are saved as JSON
+so runs can be compared for regressions with --compare.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncGenerator, Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.enums import ParseMode
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, Update, User as TgUser
+from sqlmodel import update
+
+from app.bot_app import create_dispatcher
+from app.database import async_engine
+from app.metrics import db_queries_total
+from app.migrations import migrate
+from app.models import User
+from app.services.user.cache import user_cache
+from app.services.user.service import UserService
+
+EMAIL_DOMAIN = "dispatcher-bench.example.com"
+# Telegram ids of generated users; far above real ids to avoid clashes
+FIRST_USER_ID = 9_100_000_000
+ADMIN_USER_ID = FIRST_USER_ID - 1
+
+
+class FakeSession(BaseSession):
+    """Answers every Bot API call locally and remembers the last one per chat."""
+
+    def __init__(self):
+        super().__init__()
+        self.message_ids = itertools.count(1)
+        self.last_sent: dict[int, TelegramMethod] = {}
+        self.calls = 0
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None
+    ) -> Any:
+        self.calls += 1
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            self.last_sent[chat_id] = method
+        if method.__returning__ is Message:
+            return Message(
+                message_id=next(self.message_ids),
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None),
+            ).as_(bot)
+        return True
+
+    async def stream_content(self, *args, **kwargs) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+class Harness:
+    def __init__(self, bot: Bot, dp: Dispatcher, session: FakeSession):
+        self.bot = bot
+        self.dp = dp
+        self.session = session
+        self.update_ids = itertools.count(1)
+        self.timings: list[float] = []
+
+    def _tg_user(self, tg_user_id: int) -> TgUser:
+        return TgUser(
+            id=tg_user_id, is_bot=False, first_name="Bench", last_name=str(tg_user_id),
+            username=f"bench_{tg_user_id}",
+        )
+
+    async def _feed(self, update: Update) -> None:
+        started_at = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.timings.append(time.perf_counter() - started_at)
+
+    async def message(self, tg_user_id: int, text: str) -> None:
+        message = Message(
+            message_id=next(self.update_ids),
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=tg_user_id, type="private"),
+            from_user=self._tg_user(tg_user_id),
+            text=text,
+        )
+        await self._feed(Update(update_id=next(self.update_ids), message=message))
+
+    async def callback(self, tg_user_id: int, data: str) -> None:
+        message = Message(
+            message_id=next(self.update_ids),
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=tg_user_id, type="private"),
+            text="...",
+        )
+        callback = CallbackQuery(
+            id=str(next(self.update_ids)),
+            from_user=self._tg_user(tg_user_id),
+            chat_instance="bench",
+            message=message,
+            data=data,
+        )
+        await self._feed(Update(update_id=next(self.update_ids), callback_query=callback))
+
+    def last_button(self, tg_user_id: int, text: str) -> str | None:
+        """callback_data of a button in the last message sent to the chat."""
+        markup = getattr(self.session.last_sent.get(tg_user_id), "reply_markup", None)
+        for row in getattr(markup, "inline_keyboard", []):
+            for button in row:
+                if button.text.startswith(text):
+                    return button.callback_data
+        return None
+
+
+# Each scenario runs one flow for one user id and feeds one or more updates
+
+
+async def start_new_user(h: Harness, tg_user_id: int) -> None:
+    await h.message(tg_user_id, "/start")
+
+
+async def registration(h: Harness, tg_user_id: int) -> None:
+    await h.message(tg_user_id, "/start")
+    await h.callback(tg_user_id, "register_start")
+    await h.message(tg_user_id, f"Bench User {tg_user_id}")
+    await h.message(tg_user_id, f"user{tg_user_id}@{EMAIL_DOMAIN}")
+
+
+async def start_returning_user(h: Harness, tg_user_id: int) -> None:
+    await h.message(tg_user_id, "/start")
+
+
+async def update_email(h: Harness, tg_user_id: int) -> None:
+    await h.message(tg_user_id, f"update email new{tg_user_id}@{EMAIL_DOMAIN}")
+
+
+async def admin_get_users(h: Harness, tg_user_id: int) -> None:
+    # Every flow is run by the single admin: list, then walk two pages forward
+    await h.message(ADMIN_USER_ID, "get users 10")
+    for _ in range(2):
+        data = h.last_button(ADMIN_USER_ID, "Next")
+        if data is None:
+            break
+        await h.callback(ADMIN_USER_ID, data)
+
+
+# Order matters: registration creates the users the later scenarios use
+SCENARIOS: dict[str, Callable[[Harness, int], Awaitable[None]]] = {
+    "start_new_user": start_new_user,
+    "registration": registration,
+    "start_returning_user": start_returning_user,
+    "update_email": update_email,
+    "admin_get_users": admin_get_users,
+}
+
+
+def percentile(timings: list[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+async def run_scenario(
+    h: Harness, flow: Callable[[Harness, int], Awaitable[None]], users: int, concurrency: int
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(tg_user_id: int) -> None:
+        async with semaphore:
+            await flow(h, tg_user_id)
+
+    h.timings = []
+    queries_before = db_queries_total.values.get((), 0)
+    calls_before = h.session.calls
+    started_at = time.perf_counter()
+    await asyncio.gather(*(run_one(FIRST_USER_ID + i) for i in range(users)))
+    elapsed = time.perf_counter() - started_at
+
+    updates = len(h.timings)
+    return {
+        "updates": updates,
+        "seconds": round(elapsed, 4),
+        "updates_per_sec": round(updates / elapsed, 1),
+        "p50_ms": round(statistics.median(h.timings) * 1000, 3),
+        "p99_ms": round(percentile(h.timings, 0.99) * 1000, 3),
+        "db_queries_per_update": round(
+            (db_queries_total.values.get((), 0) - queries_before) / updates, 2
+        ),
+        "api_calls_per_update": round((h.session.calls - calls_before) / updates, 2),
+    }
+
+
+async def cleanup() -> None:
+    async with async_engine.begin() as conn:
+        await conn.exec_driver_sql(
+            f"DELETE FROM users WHERE email LIKE '%@{EMAIL_DOMAIN}'"
+        )
+    user_cache.clear()
+
+
+async def create_admin() -> None:
+    await UserService.create_user(
+        tg_user_id=str(ADMIN_USER_ID),
+        tg_username="bench_admin",
+        name="Bench Admin",
+        email=f"admin@{EMAIL_DOMAIN}",
+    )
+    async with async_engine.begin() as conn:
+        await conn.execute(
+            update(User).where(User.tg_user_id == str(ADMIN_USER_ID)).values(role="admin")
+        )
+    user_cache.clear()
+
+
+def print_results(results: dict, baseline: dict | None) -> None:
+    for name, result in results["scenarios"].items():
+        line = (
+            f"{name:<22} {result['updates']:>6} updates  {result['updates_per_sec']:>8.1f}/s"
+            f"  p50={result['p50_ms']:8.2f} ms  p99={result['p99_ms']:8.2f} ms"
+            f"  {result['db_queries_per_update']:5.2f} q/update"
+        )
+        previous = (baseline or {}).get("scenarios", {}).get(name)
+        if previous:
+            change = (result["p99_ms"] - previous["p99_ms"]) / previous["p99_ms"] * 100
+            line += f"  p99 {change:+.1f}% vs baseline"
+        print(line)
+
+
+async def main(args: argparse.Namespace) -> None:
+    await migrate()
+    await cleanup()
+
+    session = FakeSession()
+    # No SendScheduler here: the benchmark measures the update pipeline, not Telegram's rate limits
+    bot = Bot(
+        token="123456:BENCHMARK", session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    # No throttling either: one admin drives the whole admin_get_users scenario
+    dp = create_dispatcher(throttling=False)
+    h = Harness(bot, dp, session)
+
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "scenarios": {},
+    }
+    try:
+        await create_admin()
+        for name, flow in SCENARIOS.items():
+            results["scenarios"][name] = await run_scenario(
+                h, flow, args.users, args.concurrency
+            )
+    finally:
+        if not args.keep:
+            await cleanup()
+        await async_engine.dispose()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500, help="users (flows) per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--output", help="save results as JSON")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the generated users")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,141 @@
+"""
+Benchmark `UserService.search_users` (pg_trgm GIN indexes) against the same
+query with index scans disabled, on a generated dataset.
+
+Run against a LOCAL database only, it inserts (and afterwards deletes) rows:
+
+    python -m benchmarks.search_users --rows 1000000 --queries 200
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import ARRAY, String, bindparam, text
+
+from app.database import async_engine
+from app.migrations import migrate
+from app.services.user.service import UserService
+
+FIRST_NAMES = ["john", "mary", "arivu", "priya", "li", "anna", "omar", "sofia", "raj", "emma"]
+LAST_NAMES = ["smith", "kumar", "chen", "garcia", "ivanova", "okafor", "silva", "nguyen", "müller", "khan"]
+
+GENERATE_QUERY = """
+INSERT INTO users (tg_user_id, tg_username, name, email, role, is_active)
+SELECT
+    'bench-' || g,
+    'user_' || substr(md5(g::text), 1, 8),
+    initcap((:first)[1 + g % 10]) || ' ' || initcap((:last)[1 + (g / 10) % 10]) || ' ' || substr(md5(g::text), 9, 6),
+    (:first)[1 + g % 10] || '.' || g || '@bench-' || (g % 97) || '.example.com',
+    'user',
+    true
+FROM generate_series(:start, :stop) AS g
+"""
+
+# Same predicate/ranking as UserService.search_users, for the seq-scan baseline
+SEARCH_SQL = """
+SELECT tg_user_id, tg_username, name, email FROM users
+WHERE is_active AND (:q <% name OR :q <% email OR :q <% tg_username)
+ORDER BY greatest(word_similarity(:q, name), word_similarity(:q, email), word_similarity(:q, tg_username)) DESC
+LIMIT 10
+"""
+
+
+def sample_queries(rows: int, count: int) -> list[str]:
+    queries = []
+    for _ in range(count):
+        g = random.randint(1, rows)
+        queries.append(
+            random.choice(
+                [
+                    random.choice(FIRST_NAMES),
+                    random.choice(LAST_NAMES)[:5],
+                    f"{random.choice(FIRST_NAMES)}.{g}",
+                    f"bench-{g % 97}.example",
+                ]
+            )
+        )
+    return queries
+
+
+def summarize(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(
+        f"{name:<12} p50={statistics.median(timings) * 1000:8.2f} ms"
+        f"  p99={p99 * 1000:8.2f} ms  mean={statistics.fmean(timings) * 1000:8.2f} ms"
+    )
+
+
+async def generate(rows: int) -> None:
+    batch = 100_000
+    started_at = time.perf_counter()
+    for start in range(1, rows + 1, batch):
+        async with async_engine.begin() as conn:
+            await conn.execute(
+                text(GENERATE_QUERY).bindparams(
+                    bindparam("first", type_=ARRAY(String)),
+                    bindparam("last", type_=ARRAY(String)),
+                ),
+                {
+                    "first": FIRST_NAMES,
+                    "last": LAST_NAMES,
+                    "start": start,
+                    "stop": min(start + batch - 1, rows),
+                },
+            )
+    async with async_engine.begin() as conn:
+        await conn.exec_driver_sql("ANALYZE users")
+    print(f"Generated {rows} users in {time.perf_counter() - started_at:.1f}s")
+
+
+async def cleanup() -> None:
+    async with async_engine.begin() as conn:
+        await conn.exec_driver_sql("DELETE FROM users WHERE tg_user_id LIKE 'bench-%'")
+
+
+async def main(args: argparse.Namespace) -> None:
+    await migrate()
+    await cleanup()
+    await generate(args.rows)
+
+    queries = sample_queries(args.rows, args.queries)
+
+    try:
+        async with async_engine.connect() as conn:
+            plan = await conn.execute(text("EXPLAIN " + SEARCH_SQL), {"q": queries[0]})
+            print("\n".join(row[0] for row in plan))
+
+        indexed = []
+        for q in queries:
+            started_at = time.perf_counter()
+            await UserService.search_users(q)
+            indexed.append(time.perf_counter() - started_at)
+
+        seq_scan = []
+        for q in queries[: args.seq_queries]:
+            async with async_engine.begin() as conn:
+                await conn.exec_driver_sql("SET LOCAL enable_bitmapscan = off")
+                await conn.exec_driver_sql("SET LOCAL enable_indexscan = off")
+                started_at = time.perf_counter()
+                await conn.execute(text(SEARCH_SQL), {"q": q})
+                seq_scan.append(time.perf_counter() - started_at)
+
+        print(f"\n{args.rows} users, {len(indexed)} queries")
+        summarize("trigram GIN", indexed)
+        summarize("seq scan", seq_scan)
+    finally:
+        if not args.keep:
+            await cleanup()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seq-queries", type=int, default=10, help="seq scans are slow, run fewer")
+    parser.add_argument("--keep", action="store_true", help="keep the generated rows")
+    asyncio.run(main(parser.parse_args()))
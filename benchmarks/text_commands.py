@@ -0,0 +1,133 @@
+"""
+Micro-benchmark of free-text command routing: the former chain of
+`F.text.startswith(...)` magic filters, evaluated in handler order until one
+matches, against a single `CommandTrie` lookup per message. No database needed:
+
+    python -m benchmarks.text_commands --messages 100000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timezone
+
+from aiogram import F
+from aiogram.types import Chat, Message
+
+from app.filters.text_command import CommandTrie
+
+# Handler order of the text commands in account.py and manage_users.py
+PHRASES = [
+    "update name",
+    "update email",
+    "get users",
+    "get user",
+    "find user",
+    "update role",
+    "delete user",
+    "broadcast",
+    "export users",
+]
+
+MAGIC_FILTERS = [
+    F.text.lower().startswith("update name "),
+    F.text.lower().startswith("update email "),
+    F.text.startswith("get users"),
+    F.text.startswith("get user"),
+    F.text.startswith("find user"),
+    F.text.startswith("update role"),
+    F.text.startswith("delete user"),
+    F.text.startswith("broadcast"),
+    F.text == "export users",
+]
+
+COMMAND_TEXTS = [
+    "get users 10",
+    "get user 1234567890",
+    "find user john",
+    "update role 1234567890 admin",
+    "delete user 1234567890",
+    "update email john@example.com",
+    "broadcast Hello everyone!",
+    "export users",
+]
+PLAIN_TEXTS = [
+    "hi",
+    "John Smith",
+    "john@example.com",
+    "how do I update my email?",
+    "Thanks! That worked perfectly, see you tomorrow.",
+]
+
+
+def make_messages(count: int, command_share: float) -> list[Message]:
+    now = datetime.now(timezone.utc)
+    chat = Chat(id=1, type="private")
+    return [
+        Message(
+            message_id=i,
+            date=now,
+            chat=chat,
+            text=random.choice(
+                COMMAND_TEXTS if random.random() < command_share else PLAIN_TEXTS
+            ),
+        )
+        for i in range(count)
+    ]
+
+
+def route_magic(messages: list[Message]) -> int:
+    matched = 0
+    for message in messages:
+        for magic in MAGIC_FILTERS:
+            if magic.resolve(message):
+                matched += 1
+                break
+    return matched
+
+
+def route_trie(messages: list[Message], trie: CommandTrie) -> int:
+    # One lookup per message; each TextCommand filter then compares the name
+    names = [frozenset([phrase]) for phrase in PHRASES]
+    matched = 0
+    for message in messages:
+        command = trie.match(message.text or message.caption)
+        if command is None:
+            continue
+        for handler_names in names:
+            if command.name in handler_names:
+                matched += 1
+                break
+    return matched
+
+
+def measure(name: str, route, messages: list[Message], *args) -> None:
+    started_at = time.perf_counter()
+    matched = route(messages, *args)
+    elapsed = time.perf_counter() - started_at
+    print(
+        f"{name:<14} {elapsed / len(messages) * 1e9:8.0f} ns/message"
+        f"  ({matched} of {len(messages)} routed)"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    trie = CommandTrie()
+    for phrase in PHRASES:
+        trie.add(phrase)
+
+    messages = make_messages(args.messages, args.command_share)
+    # Warm up both paths before timing
+    route_magic(messages[:1000])
+    route_trie(messages[:1000], trie)
+
+    print(f"{args.messages} messages, {args.command_share:.0%} commands")
+    measure("magic filters", route_magic, messages)
+    measure("command trie", route_trie, messages, trie)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--command-share", type=float, default=0.3)
+    main(parser.parse_args())
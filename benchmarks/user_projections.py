@@ -0,0 +1,100 @@
+"""
+Benchmark the column projections used by the admin user list
+(`UserListItem`) against loading full `User` ORM objects for the same page,
+at several page sizes: time per page and memory retained per row.
+
+Run against a LOCAL database only, it inserts (and afterwards deletes) rows:
+
+    python -m benchmarks.user_projections --rows 20000 --repeat 50
+"""
+
+import argparse
+import asyncio
+import gc
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import select
+
+from app.database import SessionLocal, async_engine
+from app.migrations import migrate
+from app.models import User
+from app.services.user.projections import UserListItem, columns, rows_as, users_table
+from benchmarks.search_users import cleanup, generate
+
+PAGE_SIZES = [100, 250, 500, 1000]
+
+
+async def fetch_orm(page_size: int) -> list:
+    async with SessionLocal() as db:
+        users = await db.execute(
+            select(User).order_by(User.created_at.desc(), User.id.desc()).limit(page_size)
+        )
+        return list(users.scalars().all())
+
+
+async def fetch_projection(page_size: int) -> list:
+    c = users_table.c
+    async with SessionLocal() as db:
+        users = await db.execute(
+            select(*columns(UserListItem))
+            .order_by(c.created_at.desc(), c.id.desc())
+            .limit(page_size)
+        )
+        return rows_as(UserListItem, users)
+
+
+async def bytes_per_row(fetch, page_size: int) -> float:
+    """Memory still held by the returned rows once the session is closed."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        rows = await fetch(page_size)
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return retained / len(rows)
+
+
+async def measure(name: str, fetch, page_size: int, repeat: int) -> None:
+    # Warm up the connection pool and statement caches
+    await fetch(page_size)
+
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        await fetch(page_size)
+        timings.append(time.perf_counter() - started_at)
+
+    median = statistics.median(timings)
+    print(
+        f"{name:<11} {page_size:>5} rows  page={median * 1000:8.2f} ms"
+        f"  {median / page_size * 1e6:6.2f} µs/row"
+        f"  {await bytes_per_row(fetch, page_size):7.0f} B/row"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    await migrate()
+    await cleanup()
+    await generate(args.rows)
+
+    try:
+        for page_size in PAGE_SIZES:
+            await measure("ORM", fetch_orm, page_size, args.repeat)
+            await measure("projection", fetch_projection, page_size, args.repeat)
+    finally:
+        if not args.keep:
+            await cleanup()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=50, help="timed pages per size")
+    parser.add_argument("--keep", action="store_true", help="keep the generated rows")
+    asyncio.run(main(parser.parse_args()))
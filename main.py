@@ -2,7 +2,10 @@ import asyncio
 import logging
 import sys
 
-from app.bot_app import run_the_bot
+from app.startup import startup_timer
+
+with startup_timer.phase("import"):
+    from app.bot_app import run_the_bot
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, AsyncGenerator
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message
+
+from app.models import BroadcastJob
+from app.services.broadcast import engine
+from app.services.broadcast.engine import Broadcaster
+
+ADMIN_ID = "99"
+USERS = ["1001", "1002", "1003", "1004"]
+
+
+class FakeSession(BaseSession):
+    """Answers Bot API calls locally; `failures` lists the errors to raise per chat."""
+
+    def __init__(self, failures: dict[int, list[Exception]] | None = None):
+        super().__init__()
+        self.failures = failures or {}
+        self.sent: list[SendMessage] = []
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None
+    ) -> Any:
+        self.sent.append(method)
+        pending = self.failures.get(method.chat_id)
+        if pending:
+            raise pending.pop(0)
+        return Message(
+            message_id=len(self.sent),
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=method.chat_id, type="private"),
+            text=method.text,
+        )
+
+    async def stream_content(self, *args, **kwargs) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+    def chats(self) -> list[int]:
+        return [method.chat_id for method in self.sent]
+
+
+@pytest.fixture
+def saved(monkeypatch) -> list[dict]:
+    """Stubs the DB side of the engine; returns the progress snapshots saved."""
+    snapshots = []
+
+    async def iter_active_user_ids(after=None, batch_size=1000):
+        remaining = [tg_user_id for tg_user_id in USERS if after is None or tg_user_id > after]
+        for start in range(0, len(remaining), 2):
+            yield remaining[start : start + 2]
+
+    async def save_progress(job, lease):
+        snapshots.append(
+            {"last_tg_user_id": job.last_tg_user_id, "status": job.status, "lease": lease}
+        )
+
+    monkeypatch.setattr(
+        engine.UserService, "iter_active_user_ids", staticmethod(iter_active_user_ids)
+    )
+    monkeypatch.setattr(engine.BroadcastService, "save_progress", staticmethod(save_progress))
+    return snapshots
+
+
+def run_job(session: FakeSession, job: BroadcastJob) -> None:
+    bot = Bot(token="42:TEST", session=session)
+    asyncio.run(Broadcaster(rate=1000)._run(bot, job))
+
+
+def method() -> SendMessage:
+    return SendMessage(chat_id=0, text="")
+
+
+def test_counts_delivered_blocked_and_failed(saved):
+    session = FakeSession(
+        {
+            1002: [TelegramForbiddenError(method(), "bot was blocked by the user")],
+            1003: [TelegramBadRequest(method(), "chat not found")],
+        }
+    )
+    job = BroadcastJob(created_by=ADMIN_ID, text="hello")
+
+    run_job(session, job)
+
+    assert (job.delivered, job.blocked, job.failed) == (2, 1, 1)
+    assert saved[-1] == {"last_tg_user_id": "1004", "status": "done", "lease": None}
+    report = session.sent[-1]
+    assert report.chat_id == int(ADMIN_ID)
+    assert "Delivered: <code>2</code>" in report.text
+
+
+def test_retry_after_resends_to_the_same_user(saved):
+    session = FakeSession({1001: [TelegramRetryAfter(method(), "flood", retry_after=0)]})
+    job = BroadcastJob(created_by=ADMIN_ID, text="hello")
+
+    run_job(session, job)
+
+    assert session.chats()[:2] == [1001, 1001]
+    assert (job.delivered, job.blocked, job.failed) == (4, 0, 0)
+
+
+def test_resumes_after_last_tg_user_id(saved):
+    session = FakeSession()
+    job = BroadcastJob(created_by=ADMIN_ID, text="hello", last_tg_user_id="1002", delivered=2)
+
+    run_job(session, job)
+
+    assert session.chats() == [1003, 1004, int(ADMIN_ID)]
+    assert job.delivered == 4
+
+
+def test_database_failure_is_reported_and_job_stays_resumable(saved, monkeypatch):
+    async def iter_active_user_ids(after=None, batch_size=1000):
+        yield USERS[:2]
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(
+        engine.UserService, "iter_active_user_ids", staticmethod(iter_active_user_ids)
+    )
+    session = FakeSession()
+    job = BroadcastJob(created_by=ADMIN_ID, text="hello")
+
+    run_job(session, job)
+
+    assert saved[-1] == {"last_tg_user_id": "1002", "status": "running", "lease": None}
+    report = session.sent[-1]
+    assert report.chat_id == int(ADMIN_ID)
+    assert "Stopped by OSError" in report.text
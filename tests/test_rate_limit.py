@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from app import rate_limit
+from app.rate_limit import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_starts_full_and_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert bucket.delay() == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    clock[0] += 60
+
+    assert [bucket.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+def test_pause_blocks_for_the_given_time(clock):
+    bucket = TokenBucket(rate=1, capacity=5)
+
+    bucket.pause(3)
+
+    assert not bucket.try_acquire()
+    assert bucket.delay() == pytest.approx(4)
+    clock[0] += 4
+    assert bucket.try_acquire()
+
+
+def test_release_gives_tokens_back_up_to_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.try_acquire()
+
+    bucket.release()
+    bucket.release()
+
+    assert bucket.tokens == 2
+
+
+def test_acquire_waits_for_a_token():
+    async def acquire_three() -> float:
+        bucket = TokenBucket(rate=50, capacity=1)
+        started_at = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - started_at
+
+    # Two refills at 50 tokens/s
+    assert asyncio.run(acquire_three()) >= 0.035
@@ -0,0 +1,36 @@
+from app.rendering import MESSAGE_LIMIT, Template, join_messages, message_length
+
+
+def test_template_renders_fields_and_format_specs():
+    template = Template("<b>{name}</b>: {count:>3}")
+
+    assert template.render(name="Ada", count=7) == "<b>Ada</b>:   7"
+
+
+def test_message_length_counts_utf16_units_after_entity_parsing():
+    assert message_length("<b>a&amp;b</b>") == 3
+    # Outside the BMP: two UTF-16 code units each
+    assert message_length("😀") == 2
+    assert message_length("é") == 1
+
+
+def test_parts_are_joined_while_they_fit():
+    assert join_messages("a", "", "b\n", "\nc") == ["a\n\nb\n\nc"]
+
+
+def test_split_uses_telegram_length_not_python_length():
+    emoji = "😀" * 2040  # 2040 characters, 4080 UTF-16 code units
+    messages = join_messages(emoji, "x" * 20)
+
+    assert messages == [emoji, "x" * 20]
+    assert all(message_length(message) <= MESSAGE_LIMIT for message in messages)
+
+
+def test_markup_does_not_count_towards_the_limit():
+    part = "<b>" + "x" * 2000 + "</b>"
+
+    assert join_messages(part, part) == [f"{part}\n\n{part}"]
+
+
+def test_custom_limit():
+    assert join_messages("aaa", "bbb", "ccc", limit=8) == ["aaa\n\nbbb", "ccc"]
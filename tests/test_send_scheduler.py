@@ -0,0 +1,131 @@
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+
+from app.rate_limit import TokenBucket
+from app.send_scheduler import Priority, SendScheduler, send_priority
+
+
+def drain(scheduler: SendScheduler) -> None:
+    while scheduler.global_bucket.try_acquire():
+        pass
+
+
+def test_interactive_calls_overtake_queued_bulk_calls():
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method.text)
+        return True
+
+    async def send(scheduler: SendScheduler, chat_id: int, text: str, priority: Priority):
+        send_priority.set(priority)
+        await scheduler(make_request, None, SendMessage(chat_id=chat_id, text=text))
+
+    async def run():
+        scheduler = SendScheduler(global_rate=50)
+        drain(scheduler)
+        tasks = [
+            asyncio.create_task(send(scheduler, i, f"bulk {i}", Priority.BULK))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        tasks.append(
+            asyncio.create_task(send(scheduler, 10, "reply", Priority.INTERACTIVE))
+        )
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert sent == ["reply", "bulk 0", "bulk 1", "bulk 2"]
+
+
+def test_calls_without_a_chat_are_not_rate_limited():
+    async def run():
+        scheduler = SendScheduler(global_rate=1)
+        drain(scheduler)
+
+        async def make_request(bot, method):
+            return "me"
+
+        return await asyncio.wait_for(scheduler(make_request, None, GetMe()), 0.1)
+
+    assert asyncio.run(run()) == "me"
+
+
+def test_retry_after_pauses_the_chat_and_retries():
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(method.chat_id)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method, "flood", retry_after=0)
+        return True
+
+    async def run():
+        scheduler = SendScheduler(global_rate=50)
+        return await scheduler(make_request, None, SendMessage(chat_id=1, text="hi"))
+
+    assert asyncio.run(run()) is True
+    assert calls == [1, 1]
+
+
+def test_retry_after_for_an_idle_chat_pauses_every_chat():
+    async def make_request(bot, method):
+        raise TelegramRetryAfter(method, "flood", retry_after=5)
+
+    async def run():
+        scheduler = SendScheduler(global_rate=50, max_retries=0)
+        try:
+            await scheduler(make_request, None, SendMessage(chat_id=1, text="hi"))
+        except TelegramRetryAfter:
+            pass
+        return scheduler.global_bucket.delay()
+
+    assert asyncio.run(run()) > 4
+
+
+class CountingBucket(TokenBucket):
+    def __init__(self, rate: float):
+        super().__init__(rate)
+        self.released = 0
+
+    def release(self, tokens: float = 1) -> None:
+        self.released += tokens
+        super().release(tokens)
+
+
+def test_token_handed_to_a_cancelled_waiter_is_given_back():
+    async def run():
+        scheduler = SendScheduler()
+        scheduler.global_bucket = bucket = CountingBucket(20)
+        drain(scheduler)
+        waiter = asyncio.create_task(scheduler._acquire_global(Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+
+        # The pump hands over a token, then the caller is cancelled
+        _, _, turn = scheduler._waiters[0]
+        turn.set_result(None)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler._pump.cancel()
+        return bucket.released
+
+    assert asyncio.run(run()) == 1
+
+
+def test_pump_gives_the_token_back_when_every_waiter_is_gone():
+    async def run():
+        scheduler = SendScheduler()
+        scheduler.global_bucket = bucket = CountingBucket(100)
+        drain(scheduler)
+        waiter = asyncio.create_task(scheduler._acquire_global(Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        await asyncio.wait_for(scheduler._pump, 1)
+        return bucket.released
+
+    assert asyncio.run(run()) == 1
@@ -0,0 +1,55 @@
+from app.filters.text_command import CommandTrie, ParsedCommand
+
+
+def make_trie(*phrases: str) -> CommandTrie:
+    trie = CommandTrie()
+    for phrase in phrases:
+        trie.add(phrase)
+    return trie
+
+
+def test_longest_phrase_wins():
+    trie = make_trie("get user", "get users")
+
+    assert trie.match("get users 10").name == "get users"
+    assert trie.match("get user 42") == ParsedCommand("get user", ["42"], "42")
+
+
+def test_matching_is_case_insensitive_and_ignores_extra_spaces():
+    trie = make_trie("update email")
+
+    assert trie.match("  Update   EMAIL  a@b.c ") == ParsedCommand(
+        "update email", ["a@b.c"], "a@b.c"
+    )
+
+
+def test_rest_keeps_the_text_as_typed():
+    trie = make_trie("broadcast")
+
+    command = trie.match("broadcast Hello,\n  world!")
+
+    assert command.rest == "Hello,\n  world!"
+    assert command.args == ["Hello,", "world!"]
+
+
+def test_command_without_arguments():
+    trie = make_trie("user stats")
+
+    assert trie.match("user stats") == ParsedCommand("user stats", [], "")
+
+
+def test_non_commands_and_partial_phrases_do_not_match():
+    trie = make_trie("get user", "delete user")
+
+    assert trie.match(None) is None
+    assert trie.match("") is None
+    assert trie.match("hello there") is None
+    assert trie.match("get") is None
+    assert trie.match("getuser 1") is None
+
+
+def test_add_returns_the_normalized_name():
+    trie = CommandTrie()
+
+    assert trie.add("  Get   Users ") == "get users"
+    assert trie.depth == 2
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from aiogram.types import Chat, Message, Update, User as TelegramUser
+
+from app.filters.text_command import text_commands
+from app.middlewares import throttling
+from app.middlewares.throttling import READ, WRITE, ThrottlingMiddleware, command_class
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(throttling.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_update(text: str, tg_user_id: int = 1) -> Update:
+    return Update(
+        update_id=1,
+        message=Message(
+            message_id=1,
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=tg_user_id, type="private"),
+            from_user=TelegramUser(id=tg_user_id, is_bot=False, first_name="Ada"),
+            text=text,
+        ),
+    )
+
+
+def test_write_commands_are_classified_as_writes():
+    # Normally registered by the handlers' TextCommand filters
+    for phrase in ("update email", "get user"):
+        text_commands.add(phrase)
+
+    assert command_class(make_update("update email a@b.c"), {}) == WRITE
+    assert command_class(make_update("get user 1"), {}) == READ
+    assert command_class(make_update("hello"), {}) == READ
+
+
+def test_updates_over_the_burst_are_dropped(monkeypatch):
+    middleware = ThrottlingMiddleware(limits={READ: (0.001, 2), WRITE: (0.001, 1)})
+    notices = []
+
+    async def notify(bot, event):
+        notices.append(event)
+
+    monkeypatch.setattr(middleware, "_notify", notify)
+
+    async def handler(event, data):
+        return "handled"
+
+    async def feed(text: str):
+        update = make_update(text)
+        data = {"event_from_user": update.message.from_user, "bot": None}
+        return await middleware(handler, update, data)
+
+    async def run():
+        return [await feed(text) for text in ("hi", "hi", "hi", "hi")]
+
+    assert asyncio.run(run()) == ["handled", "handled", None, None]
+    # One "slow down" notice per window, however many updates were dropped
+    assert len(notices) == 1
+
+
+def test_least_recently_seen_users_are_evicted(clock):
+    middleware = ThrottlingMiddleware(max_users=2)
+
+    for tg_user_id in (1, 2, 1, 3):
+        middleware._user(tg_user_id)
+        clock[0] += 0.01
+
+    assert list(middleware._users) == [1, 3]
+
+
+def test_idle_users_are_forgotten(clock):
+    middleware = ThrottlingMiddleware(limits={READ: (1, 5), WRITE: (0.5, 2)})
+    assert middleware.idle_after == 5
+
+    middleware._user(1)
+    clock[0] += 5
+    middleware._user(2)
+
+    assert list(middleware._users) == [2]
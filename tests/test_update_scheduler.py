@@ -0,0 +1,143 @@
+import asyncio
+
+from aiogram.types import User as TelegramUser
+
+from app.update_scheduler import UpdateScheduler
+
+
+def data_for(tg_user_id: int) -> dict:
+    return {"event_from_user": TelegramUser(id=tg_user_id, is_bot=False, first_name="Ada")}
+
+
+def test_each_users_updates_run_one_at_a_time_in_order():
+    log = []
+
+    async def run():
+        scheduler = UpdateScheduler(concurrency=10, max_pending=100)
+
+        def handler_for(name: str):
+            async def handler(event, data):
+                log.append(f"start {name}")
+                await asyncio.sleep(0.01)
+                log.append(f"end {name}")
+
+            return handler
+
+        await asyncio.gather(
+            scheduler(handler_for("a1"), None, data_for(1)),
+            scheduler(handler_for("a2"), None, data_for(1)),
+            scheduler(handler_for("b1"), None, data_for(2)),
+            scheduler(handler_for("a3"), None, data_for(1)),
+        )
+        return scheduler
+
+    scheduler = asyncio.run(run())
+
+    user_1 = [entry for entry in log if entry.endswith(("a1", "a2", "a3"))]
+    assert user_1 == ["start a1", "end a1", "start a2", "end a2", "start a3", "end a3"]
+    # Another user doesn't wait behind user 1
+    assert log.index("start b1") < log.index("end a1")
+    assert scheduler._queues == {}
+
+
+def test_concurrency_is_capped():
+    running = []
+    peak = []
+
+    async def handler(event, data):
+        running.append(data)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(data)
+
+    async def run():
+        scheduler = UpdateScheduler(concurrency=2, max_pending=100)
+        await asyncio.gather(*(scheduler(handler, None, data_for(i)) for i in range(6)))
+
+    asyncio.run(run())
+
+    assert max(peak) == 2
+
+
+def test_cancelled_update_does_not_block_the_users_queue():
+    log = []
+
+    async def run():
+        scheduler = UpdateScheduler(concurrency=10, max_pending=100)
+        release = asyncio.Event()
+
+        async def first(event, data):
+            await release.wait()
+
+        async def record(event, data):
+            log.append("third")
+
+        tasks = [
+            asyncio.create_task(scheduler(first, None, data_for(1))),
+            asyncio.create_task(scheduler(record, None, data_for(1))),
+            asyncio.create_task(scheduler(record, None, data_for(1))),
+        ]
+        await asyncio.sleep(0)
+        tasks[1].cancel()
+        release.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
+
+    assert log == ["third"]
+
+
+def test_wait_for_room_blocks_at_max_pending():
+    async def run():
+        scheduler = UpdateScheduler(concurrency=10, max_pending=1)
+        release = asyncio.Event()
+
+        async def handler(event, data):
+            await release.wait()
+
+        running = asyncio.create_task(scheduler(handler, None, data_for(1)))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(scheduler.wait_for_room())
+        await asyncio.sleep(0.01)
+        blocked = not waiting.done()
+
+        release.set()
+        await running
+        await asyncio.wait_for(waiting, 1)
+        return blocked
+
+    assert asyncio.run(run())
+
+
+def test_drain_waits_for_accepted_updates():
+    async def run():
+        scheduler = UpdateScheduler(concurrency=10, max_pending=100, shutdown_timeout=1)
+        finished = []
+
+        async def handler(event, data):
+            await asyncio.sleep(0.01)
+            finished.append(data)
+
+        tasks = [asyncio.create_task(scheduler(handler, None, data_for(i))) for i in range(3)]
+        await scheduler.drain()
+        await asyncio.gather(*tasks)
+        return len(finished)
+
+    assert asyncio.run(run()) == 3
+
+
+def test_drain_gives_up_after_the_shutdown_timeout():
+    async def run():
+        scheduler = UpdateScheduler(concurrency=10, max_pending=100, shutdown_timeout=0.01)
+
+        async def handler(event, data):
+            await asyncio.Event().wait()
+
+        task = asyncio.create_task(scheduler(handler, None, data_for(1)))
+        await scheduler.drain()
+        unfinished = not task.done()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return unfinished
+
+    assert asyncio.run(run())
@@ -0,0 +1,93 @@
+import pytest
+
+from app.models import User
+from app.services.user import cache as cache_module
+from app.services.user.cache import MISS, UserCache
+
+
+def make_user(tg_user_id: str = "1", email: str = "ada@example.com") -> User:
+    return User(tg_user_id=tg_user_id, tg_username="ada", name="Ada", email=email)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_fill_then_get_by_id_and_email():
+    cache = UserCache(max_size=10, ttl=60)
+    user = make_user()
+
+    cache.fill(user.tg_user_id, user, cache.generation)
+
+    assert cache.get("1") is user
+    assert cache.get_by_email("ada@example.com") is user
+    assert cache.stats()["hits"] == 2
+
+
+def test_missing_user_is_cached_as_none():
+    cache = UserCache(max_size=10, ttl=60)
+
+    assert cache.get("1") is MISS
+    cache.fill("1", None, cache.generation)
+
+    assert cache.get("1") is None
+
+
+def test_fill_is_dropped_when_a_write_happened_meanwhile():
+    cache = UserCache(max_size=10, ttl=60)
+    generation = cache.generation  # read starts
+
+    cache.invalidate("1")  # a write lands before the read returns
+    cache.fill("1", make_user(), generation)
+
+    assert cache.get("1") is MISS
+
+
+def test_set_replaces_the_email_index_entry():
+    cache = UserCache(max_size=10, ttl=60)
+    cache.fill("1", make_user(email="old@example.com"), cache.generation)
+
+    cache.set(make_user(email="new@example.com"))
+
+    assert cache.get_by_email("old@example.com") is MISS
+    assert cache.get_by_email("new@example.com").email == "new@example.com"
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = UserCache(max_size=10, ttl=60)
+    cache.fill("1", make_user(), cache.generation)
+
+    clock[0] += 61
+
+    assert cache.get("1") is MISS
+    assert cache.get_by_email("ada@example.com") is MISS
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = UserCache(max_size=2, ttl=60)
+    for tg_user_id in ("1", "2"):
+        user = make_user(tg_user_id, f"{tg_user_id}@example.com")
+        cache.fill(tg_user_id, user, cache.generation)
+    cache.get("1")
+
+    cache.fill("3", make_user("3", "3@example.com"), cache.generation)
+
+    assert cache.get("2") is MISS
+    assert cache.get("1") is not MISS
+    assert cache.get_by_email("2@example.com") is MISS
+    assert cache.stats()["evictions"] == 1
+
+
+def test_clear_drops_everything_and_stale_fills():
+    cache = UserCache(max_size=10, ttl=60)
+    cache.fill("1", make_user(), cache.generation)
+    generation = cache.generation
+
+    cache.clear()
+    cache.fill("2", make_user("2", "2@example.com"), generation)
+
+    assert cache.get("1") is MISS
+    assert cache.get("2") is MISS